@@ -254,21 +254,56 @@
 
 
 
-from flask import Flask, jsonify, request
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 from pdf_generator import pdf
+from profiling import profiled, profiling
 
 
 
-from config.cities import CITY_CONFIG
+from config.cities import CITY_CONFIG, canonical_city_keys
 from services.waqi_service import fetch_waqi_city_data
 from services.open_meteo_service import fetch_pm25_history
-from services.tomtom_service import fetch_tomtom_corridors
+from services.tomtom_service import fallback_aqi, fetch_tomtom_corridors
+from services.stages import StageExecutor
+from services.cache import cache_stats, track_dependencies
+from services.circuit_breaker import breaker_states, mark_degraded, track_degraded
+from services.deadline import (
+    DEADLINE_RESERVE_MS,
+    MAX_DEADLINE_MS,
+    MIN_DEADLINE_MS,
+    REPORT_DEADLINE_MS,
+    deadline_scope,
+    expired,
+    has_time,
+    remaining,
+)
+from services.http_client import latency_stats
+from services.metrics import (
+    HTTP_IN_FLIGHT,
+    HTTP_SECONDS,
+    add_server_timing,
+    register_collector,
+    render_prometheus,
+    server_timing_header,
+    stage,
+    start_server_timing,
+)
+from services.report_cache import get_report, put_report, report_cache_stats, report_key
+from services.scheduler import start_scheduler
+from services.singleflight import SingleFlight
 from services.utils import (
+    apply_corridor_aqi,
     compute_time_window,
     compute_aqi_from_pm25,
     compute_pollution_breakdown,
+    downsample_lttb,
     pearson_corr,
 )
 
@@ -277,10 +312,115 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 app.register_blueprint(pdf, url_prefix="/api")
-
+app.register_blueprint(profiling, url_prefix="/debug")
+
+# Keep every city's upstream data warm so requests are served from cache.
+if os.getenv("ENABLE_REFRESH_SCHEDULER", "0") == "1":
+    start_scheduler()
+
+# Concurrent requests for the same report wait on one build.
+_report_flight = SingleFlight()
+
+# Stage name in build_eco_report → source name used in dataQuality.
+STAGE_SOURCES = {"waqi": "waqi", "history": "open_meteo", "tomtom": "tomtom"}
+
+# Report sections (?sections=) and the fetch stages each one needs. Corridor
+# AQI, the emission breakdown and recommendations all use the WAQI snapshot.
+SECTION_STAGES = {
+    "airQuality": {"waqi", "history"},
+    "traffic": {"waqi", "tomtom"},
+    "environment": {"waqi"},
+    "insights": {"waqi", "tomtom"},
+}
+ALL_SECTIONS = tuple(SECTION_STAGES)
+
+# Cities built at once by /api/eco-report/batch (each build also uses the
+# shared stage pool, so this must be a separate pool).
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+_batch_pool = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix="batch")
+
+
+# ----------------------------------------------------------
+# REQUEST METRICS + SERVER-TIMING
+# ----------------------------------------------------------
+@app.before_request
+def _start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.server_timing = start_server_timing()
+    HTTP_IN_FLIGHT.inc()
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    start = g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    status = response.status_code
+
+    # Stage timings of this request (cache lookups, fetch stages, ...) so
+    # browser devtools show where the time went.
+    entries = list(g.server_timing)
+    if response.is_streamed:
+        # The body (e.g. the batch NDJSON) is generated after this hook and
+        # teardown have run: time the request, and keep it in flight, until
+        # the stream is closed. Its total isn't known yet for the header.
+        def on_close():
+            HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=status)
+            HTTP_IN_FLIGHT.dec()
+
+        g.metrics_on_close = True
+        response.call_on_close(on_close)
+    else:
+        elapsed = time.perf_counter() - start
+        HTTP_SECONDS.observe(elapsed, endpoint=endpoint, status=status)
+        entries.append(("total", elapsed, None))
+    if entries:
+        response.headers["Server-Timing"] = server_timing_header(entries)
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+@app.teardown_request
+def _end_request_metrics(exc):
+    if "request_start" in g and not g.get("metrics_on_close"):
+        HTTP_IN_FLIGHT.dec()
+
+
+@register_collector
+def _service_metrics():
+    caches = {"source": cache_stats(), "report": report_cache_stats()}
+    cache_samples = [
+        (cache, provider, s)
+        for cache, stats in caches.items()
+        for provider, s in stats["providers"].items()
+    ]
+    return [
+        ("cache_hits_total", "counter", "Cache hits.",
+         [({"cache": c, "provider": p}, s["hits"]) for c, p, s in cache_samples]),
+        ("cache_misses_total", "counter", "Cache misses.",
+         [({"cache": c, "provider": p}, s["misses"]) for c, p, s in cache_samples]),
+        ("cache_hit_ratio", "gauge", "Cache hit ratio since start.",
+         [({"cache": c, "provider": p}, s["hitRatio"]) for c, p, s in cache_samples]),
+        ("cache_entries", "gauge", "Entries held per cache.",
+         [({"cache": c}, stats["entries"]) for c, stats in caches.items()]),
+        ("circuit_breaker_open", "gauge", "1 while a provider's breaker is open or half-open.",
+         [({"provider": p}, int(state != "closed")) for p, state in breaker_states().items()]),
+        ("upstream_hedges_total", "counter", "Hedged duplicate upstream calls sent.",
+         [({}, latency_stats()["hedges"])]),
+        ("eco_report_builds_in_flight", "gauge", "Report builds in progress.",
+         [({}, _report_flight.in_flight())]),
+        ("eco_report_builds_coalesced_total", "counter", "Requests that shared another request's build.",
+         [({}, _report_flight.coalesced)]),
+    ]
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus text format."""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/api/eco-report", methods=["GET"])
+@profiled
 def eco_report():
     # ----------------------------------------------------------
     # 1. INPUTS
@@ -288,8 +428,209 @@ def eco_report():
     city_param = request.args.get("city", "hyderabad").strip().lower()
     range_str = request.args.get("range", "7days").strip()
 
-    cfg = CITY_CONFIG.get(city_param, CITY_CONFIG["hyderabad"])
     city_key = city_param if city_param in CITY_CONFIG else "hyderabad"
+    try:
+        window = compute_time_window(
+            range_str, request.args.get("from"), request.args.get("to")
+        )
+        max_points = parse_max_points(request.args.get("maxPoints"))
+        sections = parse_sections(request.args.get("sections"))
+        deadline_ms = parse_deadline_ms(request.args.get("deadlineMs"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Upstream calls share this budget; whatever misses it is reported as
+    # pending / stale in dataQuality instead of delaying the response.
+    with deadline_scope(deadline_ms):
+        cached, error = get_report_entry(city_key, window, max_points, sections)
+    if error is not None:
+        payload, status = error
+        return jsonify(payload), status
+
+    resp = app.response_class(cached["body"], mimetype="application/json")
+    resp.set_etag(cached["etag"])
+    return resp.make_conditional(request)  # 304 on matching If-None-Match
+
+
+@app.route("/api/eco-report/batch", methods=["GET", "POST"])
+def eco_report_batch():
+    """
+    Reports for many cities in one call, streamed as NDJSON — one line per
+    city, in completion order:
+        {"city": "delhi", "status": 200, "report": {...}}
+
+    GET  ?cities=delhi,mumbai&range=7days   (no cities → every city)
+    POST {"cities": [...], "range": "7days"}
+    Custom windows use from/to (YYYY-MM-DD), and maxPoints / sections work
+    as on /api/eco-report.
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            return jsonify({"error": "Body must be a JSON object"}), 400
+        cities = body.get("cities") or []
+        if not isinstance(cities, list) or not all(isinstance(c, str) for c in cities):
+            return jsonify({"error": "'cities' must be a list of city names"}), 400
+        range_str = str(body.get("range", "7days")).strip()
+        date_from, date_to = body.get("from"), body.get("to")
+        max_points = body.get("maxPoints")
+        sections = body.get("sections")
+    else:
+        cities = [c for c in request.args.get("cities", "").split(",") if c.strip()]
+        range_str = request.args.get("range", "7days").strip()
+        date_from, date_to = request.args.get("from"), request.args.get("to")
+        max_points = request.args.get("maxPoints")
+        sections = request.args.get("sections")
+
+    city_keys = list(dict.fromkeys(c.strip().lower() for c in cities))
+    if not city_keys:
+        city_keys = canonical_city_keys()
+
+    try:
+        window = compute_time_window(range_str, date_from, date_to)
+        max_points = parse_max_points(max_points)
+        sections = parse_sections(sections)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def build(city_key):
+        if city_key not in CITY_CONFIG:
+            return 404, {"error": "Unknown city"}
+        cached, error = get_report_entry(city_key, window, max_points, sections)
+        if error is not None:
+            payload, status = error
+            return status, {"error": payload.get("error")}
+        return 200, cached["body"]
+
+    def stream():
+        futures = {_batch_pool.submit(build, c): c for c in city_keys}
+        for fut in as_completed(futures):
+            city_key = futures[fut]
+            try:
+                status, result = fut.result()
+            except Exception as e:
+                print("Batch eco-report error:", city_key, e)
+                status, result = 500, {"error": str(e)}
+
+            head = f'{{"city": {json.dumps(city_key)}, "status": {status}, '
+            if status == 200:
+                # Splice the cached JSON body in as-is instead of re-encoding it.
+                yield head + '"report": ' + result.decode("utf-8").strip() + "}\n"
+            else:
+                yield head + f'"error": {json.dumps(result["error"])}}}\n'
+
+    return Response(stream(), mimetype="application/x-ndjson")
+
+
+def parse_max_points(value):
+    """`maxPoints` query value → int >= 4, or None when absent."""
+    if value in (None, ""):
+        return None
+    try:
+        max_points = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("maxPoints must be an integer")
+    if max_points < 4:  # room for the first, last, max and min samples
+        raise ValueError("maxPoints must be at least 4")
+    return max_points
+
+
+def parse_sections(value):
+    """
+    `sections` value (comma-separated string or list) → tuple of report
+    sections in canonical order; every section when absent.
+    """
+    if value in (None, "", []):
+        return ALL_SECTIONS
+    names = value.split(",") if isinstance(value, str) else value
+    requested = {str(n).strip() for n in names if str(n).strip()}
+    unknown = requested - set(ALL_SECTIONS)
+    if unknown:
+        raise ValueError(
+            f"Unknown section(s): {', '.join(sorted(unknown))} "
+            f"(expected any of {', '.join(ALL_SECTIONS)})"
+        )
+    return tuple(s for s in ALL_SECTIONS if s in requested) or ALL_SECTIONS
+
+
+def parse_deadline_ms(value):
+    """`deadlineMs` query value → total budget in ms (REPORT_DEADLINE_MS when absent)."""
+    if value in (None, ""):
+        return REPORT_DEADLINE_MS
+    try:
+        deadline_ms = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("deadlineMs must be an integer")
+    if not MIN_DEADLINE_MS <= deadline_ms <= MAX_DEADLINE_MS:
+        raise ValueError(
+            f"deadlineMs must be between {MIN_DEADLINE_MS} and {MAX_DEADLINE_MS}"
+        )
+    return deadline_ms
+
+
+def get_report_entry(city_key: str, window, max_points=None, sections=ALL_SECTIONS):
+    """
+    Cached report entry for (city_key, window, max_points, sections), building it
+    when needed. The cache entry is reused until it expires or any source
+    value it was built from (WAQI / Open-Meteo / TomTom) is refreshed.
+    Returns (entry, None) or (None, (error_payload, status)).
+    """
+    # The label ("Last 7 days" vs a custom "from → to") is part of the
+    # payload, so the same dates requested both ways are cached apart.
+    key = report_key(city_key, window[2], window[3], window[4], max_points, sections)
+    cached = get_report(key)
+    add_server_timing("report_cache", desc="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached, None
+    return _report_flight.do(
+        key,
+        lambda: _build_and_cache_report(key, city_key, window, max_points, sections),
+        redo=_redo_pending_report,
+    )
+
+
+def _redo_pending_report(result, error):
+    """
+    Rebuild a shared report that left sections pending (the leader's
+    deadline ran out) when this caller's own budget still has room.
+    """
+    entry = result[0] if error is None else None
+    return entry is not None and entry["pending"] and has_time()
+
+
+def _build_and_cache_report(
+    key, city_key: str, window, max_points=None, sections=ALL_SECTIONS
+):
+    """Returns (cache_entry, None) or (None, (error_payload, status))."""
+    cached = get_report(key)  # another flight may have just finished
+    if cached is not None:
+        return cached, None
+
+    with track_dependencies() as deps, track_degraded() as degraded:
+        payload, status = build_eco_report(city_key, window, max_points, sections)
+    if status != 200:
+        return None, (payload, status)
+
+    # Sources that fell back to last-known / synthetic / partial data or
+    # missed the request deadline ("pending").
+    payload["dataQuality"] = {"degraded": bool(degraded), "sources": degraded}
+
+    # app.json (not jsonify) so reports can also be built off-request.
+    # Degraded reports are not cached, so recovery shows up immediately.
+    with stage("serialize"):
+        body = app.json.dumps(payload).encode("utf-8")
+    pending = "pending" in degraded.values()
+    return put_report(key, body, deps, store=not degraded, pending=pending), None
+
+
+def build_eco_report(city_key: str, window, max_points=None, sections=ALL_SECTIONS):
+    """
+    Assemble the eco-report payload; returns (payload, http_status).
+    `max_points` caps the trend series (LTTB-downsampled, peaks kept).
+    Only the requested `sections` are returned, and only the upstream
+    fetches they need are made (see SECTION_STAGES).
+    """
+    cfg = CITY_CONFIG[city_key]
 
     waqi_city = cfg["waqiName"]
     lat, lon = cfg["coords"]
@@ -302,15 +643,51 @@ def eco_report():
         end_date,
         window_label,
         _days,
-    ) = compute_time_window(range_str)
+    ) = window
 
     # ----------------------------------------------------------
-    # 2. WAQI SNAPSHOT (CURRENT AQI + POLLUTANTS)
+    # 2. UPSTREAM FETCHES (WAQI / OPEN-METEO / TOMTOM IN PARALLEL)
     # ----------------------------------------------------------
-    waqi_data = fetch_waqi_city_data(waqi_city)
+    # None of the three depend on each other (city AQI is only applied to
+    # corridors afterwards), so latency is the slowest source, not the sum.
+    # Under a request deadline, stages still running when it is (nearly) up
+    # are left out and their sections returned empty, marked "pending".
+    # Skipped stages simply leave their inputs empty below.
+    needed = set().union(*(SECTION_STAGES[s] for s in sections))
+    stages = StageExecutor()
+    stages.submit("waqi", fetch_waqi_city_data, waqi_city)
+    if "history" in needed:
+        stages.submit("history", fetch_pm25_history, lat, lon, start_date, end_date)
+    if "tomtom" in needed:
+        stages.submit("tomtom", fetch_tomtom_corridors, city_key, radius_km=10.0)
+    fetched = stages.join(timeout=remaining(DEADLINE_RESERVE_MS / 2))
+    for name in stages.pending:
+        mark_degraded(STAGE_SOURCES[name], "pending")
 
-    if "error" in waqi_data:
-        return jsonify({"error": waqi_data["error"], "city": waqi_city}), 500
+    # ----------------------------------------------------------
+    # 3. WAQI SNAPSHOT (CURRENT AQI + POLLUTANTS)
+    # ----------------------------------------------------------
+    waqi_data = fetched.get("waqi")
+
+    if waqi_data is not None and "error" in waqi_data and expired():
+        # Failed because the budget ran out, not because WAQI did.
+        mark_degraded("waqi", "pending")
+        waqi_data = None
+    if waqi_data is not None and "error" in waqi_data:
+        # WAQI down (or its breaker open) with nothing cached: estimate the
+        # city AQI rather than failing the whole report.
+        print("WAQI error:", waqi_data["error"])
+        mark_degraded("waqi", "synthetic")
+        pollutants = dict.fromkeys(("pm25", "pm10", "no2", "co", "o3", "so2"))
+        waqi_data = {
+            "pollutants": {"aqi": fallback_aqi(city_key, 0), **pollutants},
+            "city_meta": {},
+        }
+    if waqi_data is None:
+        waqi_data = {
+            "pollutants": dict.fromkeys(("aqi", "pm25", "pm10", "no2", "co", "o3", "so2")),
+            "city_meta": {},
+        }
 
     pollutants = waqi_data["pollutants"]
     pm25 = pollutants.get("pm25")
@@ -330,12 +707,19 @@ def eco_report():
     no2_num = no2 or 0.0
 
     # ----------------------------------------------------------
-    # 3. OPEN-METEO: HISTORICAL PM2.5 (NO FUTURE DATES)
+    # 4. OPEN-METEO: HISTORICAL PM2.5 (NO FUTURE DATES)
     # ----------------------------------------------------------
-    pm25_history = fetch_pm25_history(lat, lon, start_date, end_date)
+    pm25_history = fetched.get("history", [])
+
+    # Downsample the series before building points; insights below still
+    # use the full history.
+    trend_source = pm25_history
+    if max_points is not None and len(pm25_history) > max_points:
+        keep = downsample_lttb([e["pm25"] for e in pm25_history], max_points)
+        trend_source = [pm25_history[i] for i in keep]
 
     trend_points = []
-    for entry in pm25_history:
+    for entry in trend_source:
         val = entry["pm25"]
         trend_points.append(
             {
@@ -351,79 +735,91 @@ def eco_report():
     }
 
     # ----------------------------------------------------------
-    # 4. MONTHLY-LIKE INSIGHTS (BASED ON HISTORY)
+    # 5. MONTHLY-LIKE INSIGHTS (BASED ON HISTORY)
     # ----------------------------------------------------------
     if pm25_history:
         vals = [e["pm25"] for e in pm25_history]
         avg_pm25 = round(sum(vals) / len(vals), 2)
         max_pm25 = max(vals)
         max_day = pm25_history[vals.index(max_pm25)]["date"]
+        min_pm25 = min(vals)
+        min_day = pm25_history[vals.index(min_pm25)]["date"]
         data_points = len(vals)
+
+        # Hourly extremes from the daily stats (not just the daily means)
+        peak = max(pm25_history, key=lambda e: e["pm25Max"])
+        peak_hourly = peak["pm25Max"]
+        peak_day = peak["date"]
+        avg_p95 = round(sum(e["pm25P95"] for e in pm25_history) / data_points, 2)
+        valid_hours = sum(e["validHours"] for e in pm25_history)
     else:
         avg_pm25 = None
         max_pm25 = None
         max_day = None
+        min_pm25 = None
+        min_day = None
         data_points = 0
+        peak_hourly = None
+        peak_day = None
+        avg_p95 = None
+        valid_hours = 0
 
     monthly_insights = {
         "dataPoints": data_points,
         "avgPm25": avg_pm25,
         "maxPm25": max_pm25,
         "maxPm25Date": max_day,
+        "minPm25": min_pm25,
+        "minPm25Date": min_day,
+        "peakHourlyPm25": peak_hourly,
+        "peakHourlyPm25Date": peak_day,
+        "avgDailyP95Pm25": avg_p95,
+        "validHours": valid_hours,
         "windowLabel": window_label,
     }
 
     # ----------------------------------------------------------
-    # 5. ENVIRONMENTAL BREAKDOWN (PERCENTAGES)
+    # 6. ENVIRONMENTAL BREAKDOWN (PERCENTAGES)
     # ----------------------------------------------------------
     breakdown = compute_pollution_breakdown(pm25_num, pm10_num, no2_num)
 
     # ----------------------------------------------------------
-    # 6. TOMTOM: DYNAMIC CORRIDORS (TRAFFIC + EMISSIONS)
+    # 7. TOMTOM: DYNAMIC CORRIDORS (TRAFFIC + EMISSIONS)
     # ----------------------------------------------------------
-    tomtom = fetch_tomtom_corridors(
-        city_key, radius_km=10.0, city_aqi=pollutants.get("aqi")
-    )
+    tomtom = fetched.get("tomtom") or {
+        "corridors": [],
+        "stats": {"avgCongestion": None, "maxCongestion": None},
+    }
     corridors = tomtom["corridors"]
     traffic_stats = tomtom["stats"]
 
     aqi_now = pollutants.get("aqi")
 
     # Compute local AQI per corridor (traffic → AQI impact)
-    if aqi_now is not None and corridors:
-        base_aqi = float(aqi_now)
-        avg_cong = traffic_stats["avgCongestion"] or 0.0
-
-        for c in corridors:
-            diff = c["congestionPercent"] - avg_cong
-            # Map +/- 50% congestion difference → +/- 30 AQI points
-            local_aqi = base_aqi + (diff / 50.0) * 30.0
-            c["aqi"] = max(0, min(500, round(local_aqi)))
-    else:
-        # Fallback if AQI missing
-        for c in corridors:
-            c["aqi"] = 100
+    with stage("corridor_aqi"):
+        apply_corridor_aqi(corridors, aqi_now, traffic_stats["avgCongestion"])
 
     # ----------------------------------------------------------
-    # 7. CORRELATIONS: TRAFFIC ↔ EMISSIONS / AQI
+    # 8. CORRELATIONS: TRAFFIC ↔ EMISSIONS / AQI
     # ----------------------------------------------------------
     correlations = {}
 
-    if corridors:
-        cong_list = [c["congestionPercent"] for c in corridors]
-        emis_list = [c["dailyEmissionsTons"] for c in corridors]
-        aqi_list = [c["aqi"] for c in corridors]
+    with stage("correlations"):
+        if corridors:
+            cong_list = [c["congestionPercent"] for c in corridors]
+            emis_list = [c["dailyEmissionsTons"] for c in corridors]
+            aqi_list = [c["aqi"] for c in corridors]
 
-        corr_cong_emis = pearson_corr(cong_list, emis_list)
-        if corr_cong_emis is not None:
-            correlations["congestion_emissions"] = corr_cong_emis
+            corr_cong_emis = pearson_corr(cong_list, emis_list)
+            if corr_cong_emis is not None:
+                correlations["congestion_emissions"] = corr_cong_emis
 
-        corr_cong_aqi = pearson_corr(cong_list, aqi_list)
-        if corr_cong_aqi is not None:
-            correlations["congestion_aqi"] = corr_cong_aqi
+            corr_cong_aqi = pearson_corr(cong_list, aqi_list)
+            if corr_cong_aqi is not None:
+                correlations["congestion_aqi"] = corr_cong_aqi
 
     # ----------------------------------------------------------
-    # 8. RECOMMENDATIONS (BASED ON CURRENT AQI)
+    # 9. RECOMMENDATIONS (BASED ON CURRENT AQI)
     # ----------------------------------------------------------
     rec = {
         "trafficManagement": [
@@ -459,7 +855,7 @@ def eco_report():
             )
 
     # ----------------------------------------------------------
-    # 9. FINAL RESPONSE (SHAPE MATCHES REACT FRONTEND)
+    # 10. FINAL RESPONSE (SHAPE MATCHES REACT FRONTEND)
     # ----------------------------------------------------------
     response = {
         "city": waqi_city,
@@ -490,8 +886,11 @@ def eco_report():
             "recommendations": rec,
         },
     }
+    for name in ALL_SECTIONS:
+        if name not in sections:
+            del response[name]
 
-    return jsonify(response)
+    return response, 200
 
 
 @app.route("/")
@@ -0,0 +1,181 @@
+# bench/kernels.py
+"""
+Micro-benchmarks for the pure computation kernels in services/utils.py,
+at realistic and scaled-up input sizes.
+
+    cd backend_flask
+    python -m bench.kernels                      # table on stdout
+    python -m bench.kernels --json kernels.json  # also write JSON results
+    python -m bench.kernels --filter aggregate --repeat 10
+
+Every case reports per-call timings (min / median / mean, µs) and items
+processed per second, so runs can be compared as data volume grows.
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from services.utils import (
+    aggregate_hourly_to_daily,
+    apply_corridor_aqi,
+    compute_aqi_from_pm25,
+    compute_pollution_breakdown,
+    downsample_lttb,
+    pearson_corr,
+)
+
+MIN_RUN_SECONDS = 0.05  # each timed run loops the kernel at least this long
+
+
+def _hourly_series(rng, hours, missing=0.02):
+    """Open-Meteo-style hourly (times, values) with a few null readings."""
+    start = datetime(2024, 1, 1)
+    times = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]
+    values = [None if rng.random() < missing else round(rng.uniform(5, 180), 1) for _ in times]
+    return times, values
+
+
+def _corridors(rng, count):
+    return [
+        {"congestionPercent": round(rng.uniform(0, 80), 1), "dailyEmissionsTons": rng.uniform(1, 20)}
+        for _ in range(count)
+    ]
+
+
+def build_cases(rng):
+    """[(name, items, fn)]: `fn()` runs the kernel once over `items` inputs."""
+    cases = []
+
+    for label, n in (("day", 24), ("year-hourly", 8760), ("10y-hourly", 87600)):
+        values = [rng.uniform(0, 400) for _ in range(n)]
+        cases.append((
+            f"compute_aqi_from_pm25/{label}",
+            n,
+            lambda values=values: [compute_aqi_from_pm25(v) for v in values],
+        ))
+
+    for label, n in (("city-corridors", 24), ("40-cities", 960), ("year-hourly", 8760)):
+        xs = [rng.uniform(0, 100) for _ in range(n)]
+        ys = [x * 0.4 + rng.gauss(0, 10) for x in xs]
+        cases.append((f"pearson_corr/{label}", n, lambda xs=xs, ys=ys: pearson_corr(xs, ys)))
+
+    for label, n in (("city", 1), ("40-cities", 40), ("40-cities-year-daily", 40 * 365)):
+        snapshots = [(rng.uniform(0, 200), rng.uniform(0, 250), rng.uniform(0, 80)) for _ in range(n)]
+        cases.append((
+            f"compute_pollution_breakdown/{label}",
+            n,
+            lambda snapshots=snapshots: [compute_pollution_breakdown(*s) for s in snapshots],
+        ))
+
+    for label, hours in (("7days", 7 * 24), ("365days", 365 * 24), ("730days", 730 * 24)):
+        times, values = _hourly_series(rng, hours)
+        cases.append((
+            f"aggregate_hourly_to_daily/{label}",
+            hours,
+            lambda times=times, values=values: aggregate_hourly_to_daily(times, values),
+        ))
+
+    for label, cities, per_city in (("city", 1, 24), ("40-cities", 40, 24), ("40-cities-x500", 40, 500)):
+        fleets = [_corridors(rng, per_city) for _ in range(cities)]
+        aqis = [rng.randint(40, 300) for _ in range(cities)]
+        avgs = [sum(c["congestionPercent"] for c in f) / len(f) for f in fleets]
+
+        def run(fleets=fleets, aqis=aqis, avgs=avgs):
+            for corridors, aqi, avg in zip(fleets, aqis, avgs):
+                apply_corridor_aqi(corridors, aqi, avg)
+
+        cases.append((f"apply_corridor_aqi/{label}", cities * per_city, run))
+
+    for label, n, max_points in (("365days->120", 365, 120), ("year-hourly->500", 8760, 500)):
+        values = [rng.uniform(5, 180) for _ in range(n)]
+        cases.append((
+            f"downsample_lttb/{label}",
+            n,
+            lambda values=values, max_points=max_points: downsample_lttb(values, max_points),
+        ))
+
+    return cases
+
+
+def time_case(fn, repeat):
+    """Per-call seconds for `repeat` runs, each looping fn for >= MIN_RUN_SECONDS."""
+    loops = 1
+    while True:  # calibrate like timeit.autorange
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_RUN_SECONDS:
+            break
+        loops *= 2 if elapsed > MIN_RUN_SECONDS / 10 else 10
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return samples, loops
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--filter", default="", help="only cases whose name contains this")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, items, fn in build_cases(random.Random(args.seed)):
+        if args.filter and args.filter not in name:
+            continue
+        samples, loops = time_case(fn, args.repeat)
+        best = min(samples)
+        results.append({
+            "name": name,
+            "items": items,
+            "loops": loops,
+            "minUs": round(best * 1e6, 2),
+            "medianUs": round(statistics.median(samples) * 1e6, 2),
+            "meanUs": round(statistics.fmean(samples) * 1e6, 2),
+            "itemsPerSec": round(items / best),
+        })
+
+    report = {
+        "generatedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 0
+
+    print(f"{'kernel':<48} {'items':>7} {'min µs':>12} {'median µs':>12} {'items/s':>14}")
+    for r in results:
+        print(
+            f"{r['name']:<48} {r['items']:>7} {r['minUs']:>12} "
+            f"{r['medianUs']:>12} {r['itemsPerSec']:>14}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
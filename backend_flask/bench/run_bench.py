@@ -0,0 +1,266 @@
+# bench/run_bench.py
+"""
+Offline /api/eco-report benchmark against local stub upstreams.
+
+    cd backend_flask
+    python -m bench.run_bench                                # compare to bench/baseline.json
+    python -m bench.run_bench --concurrency 1,8,32 --requests 300
+    python -m bench.run_bench --latency tomtom=lognormal:120:0.8 --error-rate waqi=0.05
+    python -m bench.run_bench --save-baseline                # record a new baseline
+
+Each concurrency level starts with empty caches (unless --keep-cache) and
+reports throughput, p50/p95/p99 latency, error / degraded responses and
+upstream calls per request. The exit status is 1 when p95 or throughput
+regress by more than --tolerance against the baseline, or the share of
+error or degraded responses grows by more than --quality-slack. App settings are read from the
+environment as usual, e.g. TOMTOM_RATE_LIMIT=1000 lifts the TomTom pacing.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.stubs import StubConfig, StubServer
+
+PROVIDERS = ("waqi", "open_meteo", "tomtom")
+BASE_URL_ENV = {
+    "waqi": "WAQI_BASE_URL",
+    "open_meteo": "OPEN_METEO_BASE_URL",
+    "tomtom": "TOMTOM_BASE_URL",
+}
+DEFAULT_LATENCY = {
+    "waqi": "lognormal:80:0.4",
+    "open_meteo": "lognormal:150:0.4",
+    "tomtom": "lognormal:60:0.5",
+}
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def _per_provider(pairs, cast, defaults):
+    """["tomtom=0.1", ...] → {provider: value} on top of `defaults`."""
+    out = dict(defaults)
+    for pair in pairs or []:
+        name, _, value = pair.partition("=")
+        if name not in PROVIDERS:
+            raise SystemExit(f"Unknown provider {name!r} (expected one of {PROVIDERS})")
+        out[name] = cast(value)
+    return out
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    rank = max(1, -(-q * len(sorted_values) // 100))  # nearest rank
+    return sorted_values[int(rank) - 1]
+
+
+def start_stubs(args):
+    latency = _per_provider(args.latency, str, DEFAULT_LATENCY)
+    errors = _per_provider(args.error_rate, float, dict.fromkeys(PROVIDERS, 0.0))
+    payload = _per_provider(args.payload_kb, float, dict.fromkeys(PROVIDERS, 0.0))
+    stubs = {}
+    for i, name in enumerate(PROVIDERS):
+        config = StubConfig(latency[name], errors[name], payload[name], seed=args.seed + i)
+        stubs[name] = StubServer(name, config).start()
+    return stubs
+
+
+def start_app(stubs):
+    """Point the services at the stubs, then import the app and serve it."""
+    for name, stub in stubs.items():
+        os.environ[BASE_URL_ENV[name]] = stub.base_url
+    os.environ["WAQ_API_KEY"] = "bench"
+    os.environ["TOMTOM_API_KEY"] = "bench"
+    os.environ["ENABLE_REFRESH_SCHEDULER"] = "0"
+    os.environ["PM25_STORE_PATH"] = os.path.join(
+        tempfile.mkdtemp(prefix="eco-bench-"), "pm25.sqlite3"
+    )
+
+    from werkzeug.serving import make_server
+
+    import app as app_module
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def reset_state():
+    """Empty every cache so a level starts cold."""
+    from services import circuit_breaker, pm25_store
+    from services.cache import _cache
+    from services.report_cache import _reports
+
+    _cache.clear()
+    _reports.clear()
+    pm25_store.clear()
+    with circuit_breaker._breakers_lock:
+        circuit_breaker._breakers.clear()
+
+
+def run_level(base_url, stubs, args, concurrency):
+    from config.cities import canonical_city_keys
+
+    cities = args.cities.split(",") if args.cities else canonical_city_keys()
+    ranges = args.ranges.split(",")
+    params = []
+    for i in range(args.requests):
+        p = {"city": cities[i % len(cities)], "range": ranges[(i // len(cities)) % len(ranges)]}
+        if args.deadline_ms:
+            p["deadlineMs"] = args.deadline_ms
+        params.append(p)
+
+    if not args.keep_cache:
+        reset_state()
+    for stub in stubs.values():
+        stub.reset_counts()
+
+    local = threading.local()
+
+    def one(p):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            resp = session.get(f"{base_url}/api/eco-report", params=p, timeout=60)
+            status = resp.status_code
+            degraded = status == 200 and resp.json()["dataQuality"]["degraded"]
+        except requests.RequestException:
+            status, degraded = None, False
+        return time.perf_counter() - start, status, degraded
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, params))
+    wall = time.perf_counter() - start
+
+    latencies = sorted(r[0] * 1000 for r in results)
+    calls = {name: stub.calls for name, stub in stubs.items()}
+    n = len(results)
+    return {
+        "requests": n,
+        "throughputRps": round(n / wall, 2),
+        "p50Ms": round(percentile(latencies, 50), 1),
+        "p95Ms": round(percentile(latencies, 95), 1),
+        "p99Ms": round(percentile(latencies, 99), 1),
+        "errors": sum(1 for r in results if r[1] != 200),
+        "degraded": sum(1 for r in results if r[2]),
+        "upstreamCallsPerRequest": round(sum(calls.values()) / n, 2),
+        "upstreamCalls": calls,
+    }
+
+
+def _share(r, field):
+    return r[field] / r["requests"] if r["requests"] else 0.0
+
+
+def compare(results, baseline, tolerance, quality_slack=0.0, out=None):
+    """
+    Print a comparison table; returns True when nothing regressed. Faster
+    but worse answers count as a regression too: the error and degraded
+    shares may not grow by more than `quality_slack` (a fraction).
+    """
+    out = out or sys.stdout
+    ok = True
+    print(
+        f"\n{'conc':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'errors':>7} {'degraded':>9} {'calls/req':>10}  vs baseline",
+        file=out,
+    )
+    for level, r in results.items():
+        base = (baseline or {}).get(level)
+        notes = []
+        if base:
+            rps_delta = (r["throughputRps"] - base["throughputRps"]) / base["throughputRps"]
+            p95_delta = (r["p95Ms"] - base["p95Ms"]) / base["p95Ms"]
+            notes.append(f"rps {rps_delta:+.0%}, p95 {p95_delta:+.0%}")
+            regressed = rps_delta < -tolerance or p95_delta > tolerance
+            for field in ("errors", "degraded"):
+                delta = _share(r, field) - _share(base, field)
+                if delta > quality_slack:
+                    notes.append(f"{field} {delta:+.0%}")
+                    regressed = True
+            if regressed:
+                notes.append("REGRESSION")
+                ok = False
+        print(
+            f"{level:>5} {r['throughputRps']:>9} {r['p50Ms']:>9} {r['p95Ms']:>9} "
+            f"{r['p99Ms']:>9} {r['errors']:>7} {r['degraded']:>9} "
+            f"{r['upstreamCallsPerRequest']:>10}  {'; '.join(notes) or '-'}",
+            file=out,
+        )
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    parser.add_argument("--cities", default="", help="comma-separated (default: every city)")
+    parser.add_argument("--ranges", default="7days,30days")
+    parser.add_argument("--deadline-ms", type=int, default=None, help="sent as deadlineMs")
+    parser.add_argument("--latency", action="append", metavar="PROVIDER=SPEC",
+                        help="fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", action="append", metavar="PROVIDER=RATE")
+    parser.add_argument("--payload-kb", action="append", metavar="PROVIDER=KB",
+                        help="extra padding added to each stub response")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-cache", action="store_true", help="don't start each level cold")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--quality-slack", type=float, default=0.05,
+                        help="allowed growth in the error / degraded share")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    if not args.verbose:
+        # The app logs every upstream call; background refreshes may still
+        # be printing at exit, so stay quiet for the rest of the process.
+        sys.stdout = open(os.devnull, "w")
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    stubs = start_stubs(args)
+    server = None
+    try:
+        server, base_url = start_app(stubs)
+        results = {}
+        for level in (int(c) for c in args.concurrency.split(",")):
+            results[str(level)] = run_level(base_url, stubs, args, level)
+    finally:
+        if server is not None:
+            server.shutdown()
+        for stub in stubs.values():
+            stub.stop()
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["levels"]
+    ok = compare(results, baseline, args.tolerance, args.quality_slack, out)
+
+    skip = {"baseline", "save_baseline", "json", "verbose"}
+    report = {"config": {k: v for k, v in vars(args).items() if k not in skip}, "levels": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}", file=out)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# bench/stubs.py
+"""
+Local fake WAQI / Open-Meteo / TomTom servers for offline benchmarks.
+
+Each stub answers the same paths and response shapes the services read,
+with a configurable latency distribution, error rate and payload padding,
+and counts the calls it receives.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def parse_latency(spec: str):
+    """
+    Latency spec → sampler returning seconds:
+        fixed:MS            always MS
+        uniform:LO:HI       uniform between LO and HI ms
+        lognormal:MEDIAN:SIGMA  long-tailed around MEDIAN ms
+    """
+    kind, *args = spec.split(":")
+    nums = [float(a) for a in args]
+    if kind == "fixed" and len(nums) == 1:
+        return lambda rng: nums[0] / 1000.0
+    if kind == "uniform" and len(nums) == 2:
+        return lambda rng: rng.uniform(nums[0], nums[1]) / 1000.0
+    if kind == "lognormal" and len(nums) == 2:
+        mu = math.log(nums[0])
+        return lambda rng: rng.lognormvariate(mu, nums[1]) / 1000.0
+    raise ValueError(f"Bad latency spec: {spec!r}")
+
+
+class StubConfig:
+    def __init__(self, latency="fixed:0", error_rate=0.0, payload_kb=0.0, seed=0):
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.padding = "x" * int(payload_kb * 1024)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def draw(self):
+        """(delay_seconds, fail) for one call."""
+        with self.rng_lock:
+            return self.sample_latency(self.rng), self.rng.random() < self.error_rate
+
+
+def _waqi_body(path, query, rng):
+    return {
+        "status": "ok",
+        "data": {
+            "aqi": rng.randint(40, 220),
+            "iaqi": {
+                "pm25": {"v": round(rng.uniform(10, 150), 1)},
+                "pm10": {"v": round(rng.uniform(20, 200), 1)},
+                "no2": {"v": round(rng.uniform(5, 60), 1)},
+                "co": {"v": round(rng.uniform(1, 10), 1)},
+            },
+            "city": {"name": path.strip("/").split("/")[-1], "geo": [0.0, 0.0]},
+        },
+    }
+
+
+def _open_meteo_body(path, query, rng):
+    start = datetime.fromisoformat(query["start_date"][0])
+    end = datetime.fromisoformat(query["end_date"][0])
+    hours = ((end - start).days + 1) * 24
+    times = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]
+    values = [round(rng.uniform(5, 120), 1) for _ in range(hours)]
+    return {"hourly": {"time": times, "pm2_5": values}}
+
+
+def _tomtom_body(path, query, rng):
+    lat, lon = (float(v) for v in query["point"][0].split(","))
+    free_flow = rng.uniform(35, 60)
+    # Snap to ~500 m so neighbouring sample points share segments, as on
+    # the real road network.
+    seg_lat, seg_lon = round(lat * 200) / 200, round(lon * 200) / 200
+    return {
+        "flowSegmentData": {
+            "currentSpeed": round(free_flow * rng.uniform(0.3, 1.0), 1),
+            "freeFlowSpeed": round(free_flow, 1),
+            "coordinates": {
+                "coordinate": [
+                    {"latitude": seg_lat, "longitude": seg_lon},
+                    {"latitude": seg_lat + 0.001, "longitude": seg_lon + 0.001},
+                ]
+            },
+        }
+    }
+
+
+BODIES = {"waqi": _waqi_body, "open_meteo": _open_meteo_body, "tomtom": _tomtom_body}
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients giving up mid-response (deadlines, hedging) are expected
+
+
+class StubServer:
+    """One provider's fake API on 127.0.0.1:<ephemeral port>, run in a thread."""
+
+    def __init__(self, provider: str, config: StubConfig):
+        self.provider = provider
+        self.config = config
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = _QuietServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(
+            target=self._server.serve_forever, name=f"stub-{self.provider}", daemon=True
+        ).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls = self.errors = 0
+
+    def _handler(self):
+        stub = self
+        build = BODIES[self.provider]
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+
+            def do_GET(self):
+                delay, fail = stub.config.draw()
+                with stub._lock:
+                    stub.calls += 1
+                    stub.errors += fail
+                time.sleep(delay)
+
+                if fail:
+                    status, body = 503, {"error": "stub failure"}
+                else:
+                    url = urlparse(self.path)
+                    with stub.config.rng_lock:
+                        body = build(url.path, parse_qs(url.query), stub.config.rng)
+                    status = 200
+                if stub.config.padding:
+                    body["_padding"] = stub.config.padding
+
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -240,3 +240,16 @@ CITY_CONFIG = {
         },
     },
 }
+
+
+def canonical_city_keys():
+    """CITY_CONFIG keys without aliases (e.g. "bengaluru" → "bangalore")."""
+    seen = set()
+    keys = []
+    for key, cfg in CITY_CONFIG.items():
+        ident = (cfg["waqiName"], cfg["coords"])
+        if ident in seen:
+            continue
+        seen.add(ident)
+        keys.append(key)
+    return keys
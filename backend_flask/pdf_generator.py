@@ -1,19 +1,40 @@
-from flask import Blueprint, request, send_file
-# from playwright.async_api import async_playwright
+from flask import Blueprint, jsonify, request, send_file, url_for
 import asyncio
+import atexit
+import os
 import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from profiling import profiled
 
 pdf = Blueprint("pdf", __name__)
 
+# Warm browser contexts kept open (= max pages rendering at once), renders
+# per context before it is replaced, and the per-render timeout.
+PDF_POOL_SIZE = int(os.getenv("PDF_POOL_SIZE", "2"))
+PDF_RECYCLE_AFTER = int(os.getenv("PDF_RECYCLE_AFTER", "50"))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "60"))
+
+# Background PDF jobs: renders at once, and seconds a finished job (and its
+# file) is kept for download.
+PDF_JOB_WORKERS = int(os.getenv("PDF_JOB_WORKERS", "2"))
+PDF_JOB_TTL = int(os.getenv("PDF_JOB_TTL", "600"))
+
+
 @pdf.route("/download-report", methods=["GET"])
+@profiled
 def download_report():
     city = request.args.get("city")
     range_value = request.args.get("range")
 
-    # IMPORTANT: use matching React port
-    url = f"http://localhost:5173/pdf-view?city={city}&range={range_value}"
-
-    pdf_path = asyncio.run(generate_pdf(url))
+    try:
+        pdf_path = generate_pdf(_report_view_url(city, range_value))
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
 
     return send_file(
         pdf_path,
@@ -23,23 +44,291 @@ def download_report():
     )
 
 
-async def generate_pdf(url):
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    pdf_path = temp_file.name
+def _report_view_url(city, range_value):
+    # IMPORTANT: use matching React port
+    return f"http://localhost:5173/pdf-view?city={city}&range={range_value}"
+
+
+# --------------------------------------------
+# Async PDF jobs: submit → poll → download
+# --------------------------------------------
+_job_pool = ThreadPoolExecutor(max_workers=PDF_JOB_WORKERS, thread_name_prefix="pdf-job")
+_jobs = {}  # job id -> job dict
+_jobs_by_key = {}  # (city, range) -> job id of the live job for it
+_jobs_lock = threading.Lock()
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
 
-        await page.goto(url, wait_until="networkidle")
+def _job_view(job):
+    view = {
+        "jobId": job["id"],
+        "city": job["city"],
+        "range": job["range"],
+        "status": job["status"],
+        "createdAt": job["createdAt"],
+        "finishedAt": job["finishedAt"],
+        "statusUrl": url_for("pdf.report_job_status", job_id=job["id"]),
+    }
+    if job["status"] == "done":
+        view["downloadUrl"] = url_for("pdf.report_job_download", job_id=job["id"])
+    if job["error"]:
+        view["error"] = job["error"]
+    return view
 
-        await page.pdf(
-            path=pdf_path,
-            format="A4",
-            print_background=True,
-            margin={"top": "20mm", "bottom": "20mm", "left": "12mm", "right": "12mm"}
+
+def _sweep_jobs():
+    """Forget finished jobs older than PDF_JOB_TTL and delete their files."""
+    now = time.monotonic()
+    with _jobs_lock:
+        expired = [j for j in _jobs.values() if j["expiresAt"] and j["expiresAt"] <= now]
+        for job in expired:
+            del _jobs[job["id"]]
+            if _jobs_by_key.get(job["key"]) == job["id"]:
+                del _jobs_by_key[job["key"]]
+    for job in expired:
+        if job["path"]:
+            try:
+                os.remove(job["path"])
+            except OSError:
+                pass
+
+
+def _run_job(job):
+    job["status"] = "running"
+    try:
+        path = generate_pdf(_report_view_url(job["city"], job["range"]))
+    except Exception as e:
+        print("PDF job failed:", job["id"], e)
+        result = {"status": "failed", "error": str(e) or type(e).__name__}
+    else:
+        result = {"status": "done", "path": path}
+
+    with _jobs_lock:
+        job.update(
+            result, finishedAt=_now_iso(), expiresAt=time.monotonic() + PDF_JOB_TTL
         )
+        # A failed job doesn't block a fresh submission for the same report.
+        if job["status"] == "failed" and _jobs_by_key.get(job["key"]) == job["id"]:
+            del _jobs_by_key[job["key"]]
+
+
+@pdf.route("/report-jobs", methods=["POST"])
+def submit_report_job():
+    """
+    Queue a PDF render and return its job right away (202). Submitting the
+    same (city, range) while a job for it is queued, running or still
+    downloadable returns that job instead of starting another render.
+    """
+    body = request.get_json(silent=True) or {}
+    city = str(body.get("city") or request.args.get("city") or "").strip().lower()
+    range_value = str(body.get("range") or request.args.get("range") or "7days").strip()
+    if not city:
+        return jsonify({"error": "city is required"}), 400
+
+    _sweep_jobs()
+    key = (city, range_value)
+    with _jobs_lock:
+        job_id = _jobs_by_key.get(key)
+        if job_id is not None:
+            return jsonify(_job_view(_jobs[job_id])), 202
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "key": key,
+            "city": city,
+            "range": range_value,
+            "status": "queued",
+            "error": None,
+            "path": None,
+            "createdAt": _now_iso(),
+            "finishedAt": None,
+            "expiresAt": None,
+        }
+        _jobs[job["id"]] = job
+        _jobs_by_key[key] = job["id"]
+    _job_pool.submit(_run_job, job)
+    return jsonify(_job_view(job)), 202
+
+
+@pdf.route("/report-jobs/<job_id>", methods=["GET"])
+def report_job_status(job_id):
+    _sweep_jobs()
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(_job_view(job))
+
+
+@pdf.route("/report-jobs/<job_id>/download", methods=["GET"])
+def report_job_download(job_id):
+    _sweep_jobs()
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    if job["status"] != "done":
+        return jsonify(_job_view(job)), 409
+    return send_file(
+        job["path"],
+        as_attachment=True,
+        download_name=f"GeoSense-{job['city']}.pdf",
+        mimetype="application/pdf"
+    )
+
+
+class BrowserPool:
+    """
+    One headless Chromium, launched on first use and kept running on its own
+    event-loop thread, with `size` warm browser contexts. Each render checks
+    a context out (so at most `size` pages render at once) and a context is
+    closed and replaced after `recycle_after` renders to cap memory growth.
+    """
+
+    def __init__(self, size: int, recycle_after: int):
+        self.size = size
+        self.recycle_after = recycle_after
+        self._loop = None
+        self._playwright = None
+        self._browser = None
+        self._contexts = None  # asyncio.Queue of [context, renders, browser]
+        self._relaunch = asyncio.Lock()
+        self._lock = threading.Lock()
+
+    def render(self, url: str, timeout: float = PDF_RENDER_TIMEOUT):
+        """Render `url` to a temporary PDF file and return its path."""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._render(url, timeout), loop)
+        try:
+            return future.result(timeout=timeout + 5)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is None:
+                try:
+                    from playwright.async_api import async_playwright
+                except ImportError:
+                    raise RuntimeError(
+                        "PDF export needs Playwright: pip install playwright "
+                        "&& playwright install chromium"
+                    )
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="pdf-browser", daemon=True
+                )
+                thread.start()
+                try:
+                    asyncio.run_coroutine_threadsafe(
+                        self._start(async_playwright), loop
+                    ).result()
+                except Exception as e:
+                    # e.g. Playwright installed but no Chromium: don't leave
+                    # the loop thread behind (the next call starts afresh).
+                    loop.call_soon_threadsafe(loop.stop)
+                    thread.join()
+                    loop.close()
+                    raise RuntimeError(f"PDF browser failed to start: {e}") from e
+                self._loop = loop
+            return self._loop
+
+    async def _start(self, async_playwright):
+        self._playwright = await async_playwright().start()
+        try:
+            await self._launch()
+        except BaseException:
+            # Stop the Playwright driver process along with whatever launched.
+            try:
+                if self._browser is not None:
+                    await self._browser.close()
+            finally:
+                await self._playwright.stop()
+                self._playwright = self._browser = self._contexts = None
+            raise
+
+    async def _launch(self):
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        self._contexts = asyncio.Queue()
+        for _ in range(self.size):
+            self._contexts.put_nowait(await self._new_slot())
+
+    async def _new_slot(self):
+        return [await self._browser.new_context(), 0, self._browser]
+
+    async def _render(self, url: str, timeout: float):
+        async with self._relaunch:
+            if not self._browser.is_connected():
+                print("PDF browser disconnected — relaunching")
+                await self._launch()
+
+        slot = await self._contexts.get()
+        try:
+            page = await slot[0].new_page()
+            try:
+                await page.goto(url, wait_until="networkidle", timeout=timeout * 1000)
+
+                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+                temp_file.close()
+                await page.pdf(
+                    path=temp_file.name,
+                    format="A4",
+                    print_background=True,
+                    margin={"top": "20mm", "bottom": "20mm", "left": "12mm", "right": "12mm"}
+                )
+                return temp_file.name
+            finally:
+                await page.close()
+        finally:
+            slot[1] += 1
+            # If the browser was relaunched, its queue already has fresh contexts.
+            if slot[2] is self._browser:
+                try:
+                    if slot[1] >= self.recycle_after:
+                        slot = await self._recycle(slot)
+                finally:
+                    self._contexts.put_nowait(slot)
+
+    async def _recycle(self, slot):
+        """
+        Swap a worn-out slot for a fresh context. If the new context can't
+        be made the old one is kept (and retried after its next render), so
+        a failed recycle never shrinks the pool; a browser that has died is
+        relaunched by the next render.
+        """
+        try:
+            fresh = await self._new_slot()
+        except Exception as e:
+            print("PDF context recycle failed:", e)
+            return slot
+        try:
+            await slot[0].close()
+        except Exception as e:
+            print("PDF context close failed:", e)
+        return fresh
+
+    def close(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            await self._browser.close()
+            await self._playwright.stop()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=10)
+        except Exception as e:
+            print("PDF browser shutdown error:", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+
+_browser_pool = BrowserPool(PDF_POOL_SIZE, PDF_RECYCLE_AFTER)
+atexit.register(_browser_pool.close)
 
-        await browser.close()
 
-    return pdf_path
+def generate_pdf(url):
+    """Render `url` with the shared browser pool; returns the PDF file path."""
+    return _browser_pool.render(url)
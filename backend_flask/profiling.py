@@ -0,0 +1,88 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+import functools
+import hmac
+import os
+
+from services.profiler import finish_profile, get_profile, recent_profiles, start_profile
+
+profiling = Blueprint("profiling", __name__)
+
+# Shared secret for ?profile=1 / X-Profile and the /debug routes, sent as
+# "X-Profile-Token: <token>" or "Authorization: Bearer <token>". Unset
+# disables on-demand profiling (slow requests are still recorded).
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+
+def _authorized():
+    if not PROFILE_TOKEN:
+        return False
+    token = request.headers.get("X-Profile-Token", "")
+    auth = request.headers.get("Authorization", "")
+    if not token and auth.startswith("Bearer "):
+        token = auth[len("Bearer "):]
+    return hmac.compare_digest(token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+
+def _profile_requested():
+    flag = request.args.get("profile") or request.headers.get("X-Profile") or ""
+    return flag.lower() in ("1", "true", "yes") and _authorized()
+
+
+def profiled(view):
+    """
+    Sample the view with the stack profiler. An authorized ?profile=1 (or
+    X-Profile: 1) request is always profiled, and gets X-Profile-Id /
+    X-Profile-Url response headers pointing at the result; any other call
+    is kept only if it is slower than PROFILE_SLOW_MS.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        profile = start_profile(request.endpoint, requested=_profile_requested())
+        if profile is None:
+            return view(*args, **kwargs)
+        response = None
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+            return response
+        finally:
+            profile.info = {
+                "method": request.method,
+                "path": request.full_path.rstrip("?"),
+                "status": response.status_code if response is not None else 500,
+            }
+            finish_profile(profile)
+            if response is not None and profile.trigger == "requested":
+                response.headers["X-Profile-Id"] = str(profile.id)
+                response.headers["X-Profile-Url"] = f"/debug/profiles/{profile.id}"
+
+    return wrapper
+
+
+@profiling.before_request
+def _require_token():
+    if not PROFILE_TOKEN:
+        return jsonify({"error": "Profiling is disabled (PROFILE_TOKEN not set)"}), 404
+    if not _authorized():
+        return jsonify({"error": "Invalid or missing profile token"}), 403
+    return None
+
+
+@profiling.route("/profiles", methods=["GET"])
+def list_profiles():
+    """Recent requested and slow-request profiles, newest first."""
+    return jsonify({"profiles": [p.summary() for p in reversed(recent_profiles())]})
+
+
+@profiling.route("/profiles/<int:profile_id>", methods=["GET"])
+def show_profile(profile_id):
+    """
+    One profile as a JSON call tree, or ?format=collapsed for folded
+    stacks (flamegraph.pl, speedscope).
+    """
+    profile = get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Unknown or expired profile"}), 404
+    if request.args.get("format") == "collapsed":
+        return Response(profile.collapsed(), mimetype="text/plain")
+    return jsonify({**profile.summary(), "callTree": profile.call_tree()})
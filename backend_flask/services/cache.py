@@ -0,0 +1,266 @@
+# services/cache.py
+
+import contextvars
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from services.circuit_breaker import mark_degraded
+from services.deadline import DeadlineExceeded, expired, has_time
+from services.singleflight import SingleFlight
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+
+# Seconds each provider's responses stay fresh.
+SOURCE_TTLS = {
+    "waqi": int(os.getenv("WAQI_CACHE_TTL", "900")),  # station data ~hourly
+    "open_meteo": int(os.getenv("OPEN_METEO_CACHE_TTL", "3600")),  # window incl. today
+    "open_meteo_closed": int(os.getenv("OPEN_METEO_CLOSED_CACHE_TTL", "86400")),  # past days only
+    "tomtom": int(os.getenv("TOMTOM_CACHE_TTL", "120")),  # live traffic
+}
+
+# How long past its TTL a value may still be served while a background
+# refresh runs (stale-while-revalidate).
+STALE_GRACE = {
+    "waqi": int(os.getenv("WAQI_STALE_GRACE", "3600")),
+    "open_meteo": int(os.getenv("OPEN_METEO_STALE_GRACE", "21600")),
+    "tomtom": int(os.getenv("TOMTOM_STALE_GRACE", "600")),
+}
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache: entries are fresh for `ttl` seconds, may
+    be served stale for a further `stale_ttl`, and the least recently used
+    entry is evicted once `maxsize` is reached. Expired entries are kept
+    (until evicted) as a last-known value for outages, see last_value(). Hits / misses are counted
+    per provider (the first element of the key). Every `set` stamps the
+    entry with a new version number, so callers can tell when a value they
+    used has since been refreshed.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        # key -> (fresh_until, stale_until, version, value)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self._hits = {}
+        self._misses = {}
+
+    def get(self, key):
+        """Return (found, value); stale entries count as found."""
+        found, _version, value, _fresh = self.get_versioned(key)
+        return found, value
+
+    def get_versioned(self, key):
+        """Return (found, version, value, fresh)."""
+        provider = key[0]
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(key)
+                self._hits[provider] = self._hits.get(provider, 0) + 1
+                return True, entry[2], entry[3], entry[0] > now
+            self._misses[provider] = self._misses.get(provider, 0) + 1
+            return False, None, None, False
+
+    def last_value(self, key):
+        """Return (found, value) even if the entry has expired (no hit/miss counted)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            return True, entry[3]
+
+    def version(self, key):
+        """Version of the live entry for `key`, or None (no hit/miss counted)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return entry[2]
+
+    def set(self, key, value, ttl: float, stale_ttl: float = 0):
+        with self._lock:
+            version = next(self._versions)
+            now = time.monotonic()
+            self._data[key] = (now + ttl, now + ttl + stale_ttl, version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+            return version
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            providers = set(self._hits) | set(self._misses)
+            out = {"entries": len(self._data), "maxEntries": self.maxsize, "providers": {}}
+            for p in sorted(providers):
+                hits = self._hits.get(p, 0)
+                misses = self._misses.get(p, 0)
+                out["providers"][p] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hitRatio": round(hits / (hits + misses), 3) if hits + misses else None,
+                }
+            return out
+
+
+_cache = TTLCache(CACHE_MAX_ENTRIES)
+
+# {key: version} of every cached source read in the current request,
+# set by track_dependencies().
+_dependencies = contextvars.ContextVar("cache_dependencies", default=None)
+
+# Set by refreshing(): skip lookups and always reload (used by the scheduler).
+_force_refresh = contextvars.ContextVar("cache_force_refresh", default=False)
+
+# Background revalidation of stale entries; one in flight per key.
+_revalidate_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="revalidate")
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+# Concurrent misses on the same key share one upstream call.
+_flights = SingleFlight()
+
+
+def _normalize(value):
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, str):
+        return value.strip().lower()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def make_key(provider: str, **params):
+    """Cache key from provider name + normalized, order-independent params."""
+    return (provider,) + tuple(sorted((k, _normalize(v)) for k, v in params.items()))
+
+
+def cached_call(key, loader, ttl: float = None, cacheable=bool):
+    """
+    Return the cached value for `key`, or call `loader()` and store its
+    result when `cacheable(result)` is true (errors / empty payloads are
+    not cached so the next request retries the provider).
+
+    A stale value is returned immediately and refreshed in the background;
+    concurrent misses for the same key wait on a single `loader()` call.
+    If the loader fails (raises or returns something not cacheable) the
+    last known value is served instead and the provider is marked degraded.
+    A load cut short by the request deadline is finished in the background
+    so the next request finds the value cached.
+    """
+    found = False
+    if not _force_refresh.get():
+        found, version, value, fresh = _cache.get_versioned(key)
+        if found and not fresh:
+            _revalidate(key, loader, ttl, cacheable)
+
+    if not found:
+        def load():
+            loaded = loader()
+            return loaded, _store(key, loaded, ttl) if cacheable(loaded) else None
+
+        try:
+            value, version = _flights.do(key, load, redo=_redo_after_deadline)
+        except Exception:
+            if expired():
+                _revalidate(key, loader, ttl, cacheable)
+            has_last, last = _cache.last_value(key)
+            if not has_last:
+                raise
+            mark_degraded(key[0], "stale")
+            return last
+
+        if version is None:
+            if expired():
+                _revalidate(key, loader, ttl, cacheable)
+            has_last, last = _cache.last_value(key)
+            if has_last:
+                mark_degraded(key[0], "stale")
+                return last
+            return value
+
+    deps = _dependencies.get()
+    if deps is not None:
+        deps[key] = version
+    return value
+
+
+def _redo_after_deadline(_result, error):
+    # The shared load ran out of its leader's deadline; retry with ours.
+    return isinstance(error, DeadlineExceeded) and has_time()
+
+
+def _store(key, value, ttl):
+    ttl = ttl if ttl is not None else SOURCE_TTLS[key[0]]
+    return _cache.set(key, value, ttl, STALE_GRACE.get(key[0], 0))
+
+
+def _revalidate(key, loader, ttl, cacheable):
+    with _revalidating_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+
+    def run():
+        try:
+            value = loader()
+            if cacheable(value):
+                _store(key, value, ttl)
+        except Exception as e:
+            print("Cache revalidation error:", key[0], e)
+        finally:
+            with _revalidating_lock:
+                _revalidating.discard(key)
+
+    # Fresh context: no request deadline / dependency tracking applies.
+    _revalidate_pool.submit(contextvars.Context().run, run)
+
+
+@contextmanager
+def refreshing():
+    """Inside this block cached_call() always reloads and re-stores values."""
+    token = _force_refresh.set(True)
+    try:
+        yield
+    finally:
+        _force_refresh.reset(token)
+
+
+@contextmanager
+def track_dependencies():
+    """
+    Collect {key: version} for every cached source value used inside the
+    block (including stages run via services.stages.submit_in_context).
+    """
+    deps = {}
+    token = _dependencies.set(deps)
+    try:
+        yield deps
+    finally:
+        _dependencies.reset(token)
+
+
+def dependencies_current(deps):
+    """True while none of the tracked source values was refreshed or expired."""
+    return all(_cache.version(key) == version for key, version in deps.items())
+
+
+def cache_stats():
+    return _cache.stats()
@@ -0,0 +1,118 @@
+# services/circuit_breaker.py
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a provider whose breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    closed    → calls pass; `failure_threshold` consecutive failures open it.
+    open      → calls fail fast until `reset_timeout` seconds have passed.
+    half_open → exactly one probe call is let through; success closes the
+                breaker, failure re-opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                print(f"Circuit {self.name}: closed")
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Give back an allowed call without recording an outcome."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit {self.name}: open")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str):
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(
+                provider, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+            )
+        return breaker
+
+
+def breaker_states():
+    with _breakers_lock:
+        return {name: b.state for name, b in _breakers.items()}
+
+
+# --------------------------------------------
+# Degraded-data marks for the current request
+# --------------------------------------------
+_degraded = contextvars.ContextVar("degraded_sources", default=None)
+
+
+@contextmanager
+def track_degraded():
+    """
+    Collect {provider: reason} for every source that fell back during the
+    block ("stale" = last cached value, "synthetic" = generated values,
+    "partial" = some data missing).
+    """
+    marks = {}
+    token = _degraded.set(marks)
+    try:
+        yield marks
+    finally:
+        _degraded.reset(token)
+
+
+def mark_degraded(provider: str, reason: str):
+    marks = _degraded.get()
+    if marks is not None:
+        marks.setdefault(provider, reason)
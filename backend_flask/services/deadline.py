@@ -0,0 +1,60 @@
+# services/deadline.py
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+import requests
+
+# Default total latency budget for /api/eco-report (override per request
+# with ?deadlineMs=) and the accepted range for the parameter.
+REPORT_DEADLINE_MS = int(os.getenv("REPORT_DEADLINE_MS", "1500"))
+MIN_DEADLINE_MS = 100
+MAX_DEADLINE_MS = 30000
+
+# Kept back from upstream calls for assembling and serializing the response.
+DEADLINE_RESERVE_MS = int(os.getenv("DEADLINE_RESERVE_MS", "100"))
+
+# Absolute time.monotonic() deadline of the current request, if any.
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """An upstream call was skipped or cut short by the request deadline."""
+
+
+@contextmanager
+def deadline_scope(budget_ms: float):
+    """
+    Give everything inside the block (including stages run via
+    services.stages.submit_in_context) `budget_ms` milliseconds in total.
+    """
+    token = _deadline.set(time.monotonic() + budget_ms / 1000.0)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def has_time(min_ms: float = MIN_DEADLINE_MS):
+    """True without a deadline, or while at least `min_ms` of upstream time is left."""
+    left = remaining()
+    return left is None or left * 1000 >= min_ms
+
+
+def remaining(reserve_ms: float = DEADLINE_RESERVE_MS):
+    """
+    Seconds left for upstream work (the deadline minus `reserve_ms`), never
+    below 0; None when no deadline is set.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - reserve_ms / 1000.0 - time.monotonic())
+
+
+def expired():
+    """True once the upstream part of the current budget is used up."""
+    left = remaining()
+    return left is not None and left <= 0
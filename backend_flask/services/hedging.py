@@ -0,0 +1,57 @@
+# services/hedging.py
+
+import math
+import threading
+from collections import deque
+
+
+class LatencyTracker:
+    """Rolling window of the last `window` call latencies (seconds)."""
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self):
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, q: float):
+        """Nearest-rank percentile (0 < q <= 100) of the window, or None if empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(1, math.ceil(q / 100.0 * len(samples)))
+        return samples[rank - 1]
+
+
+class HedgeBudget:
+    """
+    Global cap on hedged (duplicate) calls: every primary call earns `ratio`
+    of a hedge, at most `burst` hedges can be saved up, and each hedge
+    spends one. Extra upstream load therefore stays below `ratio`.
+    """
+
+    def __init__(self, ratio: float, burst: int):
+        self.ratio = ratio
+        self.burst = burst
+        self._credits = 0.0
+        self._lock = threading.Lock()
+        self.spent = 0
+
+    def earn(self):
+        with self._lock:
+            self._credits = min(self.burst, self._credits + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._credits < 1:
+                return False
+            self._credits -= 1
+            self.spent += 1
+            return True
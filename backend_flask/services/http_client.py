@@ -0,0 +1,277 @@
+# services/http_client.py
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services.circuit_breaker import CircuitOpenError, get_breaker
+from services.deadline import DeadlineExceeded, remaining
+from services.hedging import HedgeBudget, LatencyTracker
+from services.metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_SECONDS
+from services.rate_limit import TokenBucket
+from services.stages import submit_in_context
+from services import upstream_archive
+from services.upstream_archive import UPSTREAM_MODE
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, default))
+
+
+# --------------------------------------------
+# Per-provider connection / retry settings
+# (override with e.g. WAQI_READ_TIMEOUT=5)
+# --------------------------------------------
+PROVIDERS = {
+    "waqi": {
+        "connect_timeout": _env_float("WAQI_CONNECT_TIMEOUT", 3.05),
+        "read_timeout": _env_float("WAQI_READ_TIMEOUT", 10),
+        "retries": _env_int("WAQI_RETRIES", 2),
+        "pool_size": _env_int("WAQI_POOL_SIZE", 10),
+        "hedge": os.getenv("WAQI_HEDGE", "1") == "1",
+    },
+    "open_meteo": {
+        "connect_timeout": _env_float("OPEN_METEO_CONNECT_TIMEOUT", 3.05),
+        "read_timeout": _env_float("OPEN_METEO_READ_TIMEOUT", 10),
+        "retries": _env_int("OPEN_METEO_RETRIES", 2),
+        "pool_size": _env_int("OPEN_METEO_POOL_SIZE", 10),
+    },
+    "tomtom": {
+        "connect_timeout": _env_float("TOMTOM_CONNECT_TIMEOUT", 3.05),
+        "read_timeout": _env_float("TOMTOM_READ_TIMEOUT", 8),
+        "retries": _env_int("TOMTOM_RETRIES", 1),
+        "pool_size": _env_int("TOMTOM_POOL_SIZE", 10),
+        "hedge": os.getenv("TOMTOM_HEDGE", "1") == "1",
+        "rate_limit": _env_float("TOMTOM_RATE_LIMIT", 50),  # calls / second
+        "rate_burst": _env_int("TOMTOM_RATE_BURST", 100),  # calls without pacing
+    },
+}
+
+# Exponential backoff (0.3s, 0.6s, ...) plus up to 0.3s of random jitter so
+# retries from concurrent requests don't land on the provider in lockstep.
+RETRY_BACKOFF_FACTOR = 0.3
+RETRY_BACKOFF_JITTER = 0.3
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Retries would overrun a request deadline, so calls made under one get a
+# single attempt with the remaining time as their timeout.
+_NO_RETRY = Retry(0, read=False)
+
+
+class _DeadlineAwareAdapter(HTTPAdapter):
+    """HTTPAdapter that drops its retry policy while a request deadline is set."""
+
+    @property
+    def max_retries(self):
+        return self._max_retries if remaining() is None else _NO_RETRY
+
+    @max_retries.setter
+    def max_retries(self, value):
+        self._max_retries = value
+
+
+def _build_session(cfg):
+    retry = Retry(
+        total=cfg["retries"],
+        connect=cfg["retries"],
+        read=cfg["retries"],
+        status=cfg["retries"],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        backoff_jitter=RETRY_BACKOFF_JITTER,
+        respect_retry_after_header=True,
+        raise_on_status=False,  # hand the last response back to the caller
+    )
+    adapter = _DeadlineAwareAdapter(
+        pool_connections=4,  # distinct hosts kept per provider
+        pool_maxsize=cfg["pool_size"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# One keep-alive session (and connection pool per host) for each provider.
+_sessions = {name: _build_session(cfg) for name, cfg in PROVIDERS.items()}
+
+# Provider-wide call pacing for providers with a "rate_limit" (bursts
+# default to one second's worth of calls).
+_rate_limiters = {
+    name: TokenBucket(
+        cfg["rate_limit"], burst=cfg.get("rate_burst") or max(1, int(cfg["rate_limit"]))
+    )
+    for name, cfg in PROVIDERS.items()
+    if cfg.get("rate_limit")
+}
+
+# --------------------------------------------
+# Hedged requests: when a call to a provider with "hedge" runs past that
+# provider's rolling p95 latency, a duplicate is sent and the first answer
+# wins. Hedges are capped globally at HEDGE_MAX_RATIO of all calls.
+# --------------------------------------------
+HEDGE_PERCENTILE = _env_float("HEDGE_PERCENTILE", 95)
+HEDGE_MAX_RATIO = _env_float("HEDGE_MAX_RATIO", 0.05)
+HEDGE_MIN_SAMPLES = _env_int("HEDGE_MIN_SAMPLES", 20)  # before p95 is trusted
+HEDGE_MIN_DELAY = _env_float("HEDGE_MIN_DELAY_MS", 20) / 1000.0
+LATENCY_WINDOW = _env_int("LATENCY_WINDOW", 256)
+
+_latency = {name: LatencyTracker(LATENCY_WINDOW) for name in PROVIDERS}
+_hedge_budget = HedgeBudget(HEDGE_MAX_RATIO, burst=10)
+_hedge_pool = ThreadPoolExecutor(
+    max_workers=_env_int("HEDGE_POOL_SIZE", 32), thread_name_prefix="hedge"
+)
+
+
+def _send(provider, url, params, timeout):
+    """
+    One attempt on the provider's session (or from the upstream archive in
+    replay mode); records its latency on a response.
+    """
+    start = time.perf_counter()
+    if UPSTREAM_MODE == "replay":
+        resp = upstream_archive.replay(provider, url, params, timeout)
+    else:
+        resp = _sessions[provider].get(url, params=params, timeout=timeout)
+    _latency[provider].record(time.perf_counter() - start)
+    return resp
+
+
+def _hedge_delay(provider, breaker, left):
+    """Seconds to wait before hedging a call, or None to send it unhedged."""
+    if not PROVIDERS[provider].get("hedge") or breaker.state != "closed":
+        return None
+    tracker = _latency[provider]
+    if tracker.count() < HEDGE_MIN_SAMPLES:
+        return None
+    delay = max(HEDGE_MIN_DELAY, tracker.percentile(HEDGE_PERCENTILE))
+    if left is not None and left <= delay:
+        return None  # no time left for a second attempt to help
+    return delay
+
+
+def _send_hedged(provider, url, params, timeout, delay):
+    """
+    Send the call; if it hasn't answered after `delay` seconds (and the
+    global hedge budget allows) send a duplicate. Returns the first
+    response; raises only when every attempt failed.
+    """
+    primary = submit_in_context(_hedge_pool, _send, provider, url, params, timeout)
+    done, _ = wait([primary], timeout=delay)
+    if done or not _hedge_budget.try_spend():
+        return primary.result()
+
+    def hedge():
+        limiter = _rate_limiters.get(provider)
+        if limiter is not None and not limiter.acquire(timeout=remaining()):
+            raise DeadlineExceeded(f"{provider}: request deadline exceeded waiting for rate limit")
+        return _send(provider, url, params, timeout)
+
+    attempts = [primary, submit_in_context(_hedge_pool, hedge)]
+    while attempts:
+        done, _ = wait(attempts, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                return fut.result()
+            attempts.remove(fut)
+    return primary.result()  # both failed: raise the primary's error
+
+
+def get(provider: str, url: str, params=None):
+    """
+    GET `url` through the provider's pooled session with its own
+    (connect, read) timeouts and retry policy. Returns the requests.Response;
+    connection errors that survive the retries are raised as usual.
+
+    Calls are paced by the provider's rate limit, if it has one. While the
+    provider's circuit breaker is open this raises CircuitOpenError
+    immediately instead of waiting for a timeout.
+
+    Under a request deadline (services.deadline) both timeouts are capped
+    at the time remaining, and DeadlineExceeded is raised once it runs out.
+
+    Calls to providers with "hedge" enabled are duplicated when they run
+    past the provider's rolling p95 latency (see _send_hedged).
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{provider}: request deadline exceeded")
+
+    breaker = get_breaker(provider)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{provider} circuit open")
+
+    # Never queue for a token past the deadline: a call that would only be
+    # paced out after it is skipped, leaving the token to callers with time.
+    limiter = _rate_limiters.get(provider)
+    if limiter is not None and not limiter.acquire(timeout=left):
+        breaker.release()
+        raise DeadlineExceeded(f"{provider}: request deadline exceeded waiting for rate limit")
+
+    cfg = PROVIDERS[provider]
+    timeout = (cfg["connect_timeout"], cfg["read_timeout"])
+    left = remaining()
+    clipped = left is not None and left < max(timeout)
+    if clipped:
+        if left <= 0:
+            breaker.release()
+            raise DeadlineExceeded(f"{provider}: request deadline exceeded")
+        timeout = (min(timeout[0], left), min(timeout[1], left))
+
+    _hedge_budget.earn()
+    delay = _hedge_delay(provider, breaker, left)
+    start = time.perf_counter()
+    try:
+        with UPSTREAM_IN_FLIGHT.track(provider=provider):
+            if delay is None:
+                resp = _send(provider, url, params, timeout)
+            else:
+                resp = _send_hedged(provider, url, params, timeout, delay)
+    except requests.Timeout as e:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, provider=provider, outcome="timeout")
+        if clipped:
+            # Slower than our budget, not necessarily unhealthy.
+            breaker.release()
+            raise DeadlineExceeded(f"{provider}: request deadline exceeded") from e
+        breaker.record_failure()
+        raise
+    except requests.RequestException:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, provider=provider, outcome="error")
+        breaker.record_failure()
+        raise
+
+    elapsed = time.perf_counter() - start
+    UPSTREAM_SECONDS.observe(
+        elapsed, provider=provider, outcome="ok" if resp.status_code < 400 else "http_error"
+    )
+    if resp.status_code >= 500 or resp.status_code == 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if UPSTREAM_MODE == "record":
+        # Only the response actually used (not losing hedges) is archived.
+        upstream_archive.record(provider, url, params, resp, elapsed)
+    return resp
+
+
+def latency_stats():
+    """Rolling p50 / p95 (ms) per provider and the number of hedges sent."""
+    out = {"hedges": _hedge_budget.spent, "providers": {}}
+    for name, tracker in _latency.items():
+        p50, p95 = tracker.percentile(50), tracker.percentile(95)
+        out["providers"][name] = {
+            "samples": tracker.count(),
+            "p50Ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95Ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+    return out
@@ -0,0 +1,212 @@
+# services/metrics.py
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cache hits (sub-ms) up to slow multi-second upstreams.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            labels = _labels(self.label_names, key, [("le", _number(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_number(round(total, 6))}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+_registry = []
+
+# Callables returning extra samples at scrape time:
+# [(name, kind, help, [(labels_dict, value), ...]), ...]
+_collectors = []
+
+
+def register_collector(fn):
+    _collectors.append(fn)
+    return fn
+
+
+def render_prometheus():
+    """Every metric and collector in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_str = _labels(labels.keys(), labels.values())
+                lines.append(f"{name}{label_str} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------
+# Shared metrics
+# --------------------------------------------
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "API request latency.", ["endpoint", "status"]
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "API requests being handled.")
+STAGE_SECONDS = Histogram(
+    "eco_report_stage_duration_seconds", "Time spent in each eco-report stage.", ["stage"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds",
+    "Upstream API call latency (including retries and hedges).",
+    ["provider", "outcome"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight", "Upstream API calls in progress.", ["provider"]
+)
+
+
+# --------------------------------------------
+# Server-Timing for the current request
+# --------------------------------------------
+_server_timing = contextvars.ContextVar("server_timing", default=None)
+
+
+def start_server_timing():
+    """Begin collecting Server-Timing entries for the current request."""
+    entries = []
+    _server_timing.set(entries)
+    return entries
+
+
+def add_server_timing(name: str, seconds: float = None, desc: str = None):
+    entries = _server_timing.get()
+    if entries is not None:
+        entries.append((name, seconds, desc))
+
+
+def server_timing_header(entries):
+    parts = []
+    for name, seconds, desc in entries:
+        part = name
+        if desc:
+            part += f';desc="{desc}"'
+        if seconds is not None:
+            part += f";dur={seconds * 1000:.1f}"
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def record_stage(name: str, seconds: float):
+    """Observe a stage duration in the histogram and the Server-Timing header."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    add_server_timing(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the block as eco-report stage `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
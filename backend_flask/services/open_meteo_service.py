@@ -1,17 +1,146 @@
 # services/open_meteo_service.py
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
 import requests
-from datetime import date
 
-OPEN_METEO_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+from services import http_client
+from services.cache import SOURCE_TTLS, cached_call, make_key
+from services.circuit_breaker import mark_degraded
+from services.deadline import DeadlineExceeded, expired
+from services import pm25_store
+from services.stages import submit_in_context
+from services.upstream_archive import UPSTREAM_MODE
+from services.utils import aggregate_hourly_to_daily
+
+# Base URL is overridable so benchmarks can point at a local stub.
+OPEN_METEO_BASE_URL = os.getenv(
+    "OPEN_METEO_BASE_URL", "https://air-quality-api.open-meteo.com"
+).rstrip("/")
+OPEN_METEO_URL = f"{OPEN_METEO_BASE_URL}/v1/air-quality"
+
+# Long windows are downloaded as month-sized requests, this many at a time.
+OPEN_METEO_MAX_CONCURRENCY = int(os.getenv("OPEN_METEO_MAX_CONCURRENCY", "4"))
+_executor = ThreadPoolExecutor(
+    max_workers=OPEN_METEO_MAX_CONCURRENCY, thread_name_prefix="open-meteo"
+)
 
 
 def fetch_pm25_history(lat: float, lon: float, start_date: date, end_date: date):
     """
-    Uses Open-Meteo to fetch hourly PM2.5 and aggregate to daily averages
+    Uses Open-Meteo to fetch hourly PM2.5 and aggregate to daily stats
     between [start_date, end_date].
-    Returns: list[{ "date": "YYYY-MM-DD", "pm25": float }]
+    Returns: list[{ "date": "YYYY-MM-DD", "pm25": mean, "pm25Min", "pm25Max",
+                    "pm25P95", "validHours" }]
+    """
+    # Windows that end before today can no longer change → keep them longer.
+    closed = end_date < datetime.utcnow().date()
+    try:
+        daily, complete = cached_call(
+            make_key("open_meteo", lat=lat, lon=lon, start=start_date, end=end_date),
+            lambda: _load_history(lat, lon, start_date, end_date),
+            ttl=SOURCE_TTLS["open_meteo_closed" if closed else "open_meteo"],
+            cacheable=lambda result: result[1] and bool(result[0]),
+        )
+    except DeadlineExceeded:
+        # Missed the request deadline (and nothing cached): not an outage.
+        mark_degraded("open_meteo", "pending")
+        return []
+    if not complete:
+        mark_degraded("open_meteo", "partial" if daily else "unavailable")
+    return daily
+
+
+def _load_history(lat: float, lon: float, start_date: date, end_date: date):
+    """
+    Serve finished days from the local store and download only the days
+    that are missing or still open (normally just today).
+    Returns (daily, complete); complete is False if any download failed.
+    Raises DeadlineExceeded if the request deadline cut a download short.
+
+    When recording or replaying upstream traffic the store is bypassed, so
+    archives hold whole windows and replays don't depend on local state.
+    """
+    use_store = UPSTREAM_MODE == "live"
+    stored = pm25_store.load_days(lat, lon, start_date, end_date) if use_store else {}
+
+    days = [
+        start_date + timedelta(days=i)
+        for i in range((end_date - start_date).days + 1)
+    ]
+    missing = [d for d in days if d.isoformat() not in stored]
+
+    # One request per calendar month of each contiguous run of missing days,
+    # fetched in parallel. Each chunk is reduced to daily stats as soon as it
+    # arrives, so only a few months of hourly values are ever held at once.
+    chunks = [
+        chunk
+        for run_start, run_end in _contiguous_runs(missing)
+        for chunk in _month_chunks(run_start, run_end)
+    ]
+    futures = [
+        submit_in_context(_executor, _fetch_daily_pm25, lat, lon, chunk_start, chunk_end)
+        for chunk_start, chunk_end in chunks
+    ]
+
+    fetched = []
+    complete = True
+    cut_short = None
+    for fut in futures:  # in date order
+        try:
+            daily = fut.result()
+        except DeadlineExceeded as e:
+            cut_short = e  # days that did arrive are still stored below
+            continue
+        if daily is None:
+            complete = False
+            continue
+        if use_store:
+            pm25_store.save_days(lat, lon, daily)
+        fetched.extend(daily)
+
+    if cut_short is not None:
+        raise cut_short
+
+    merged = dict(stored)
+    for entry in fetched:
+        merged[entry["date"]] = entry
+
+    return [merged[day] for day in sorted(merged)], complete
+
+
+def _contiguous_runs(days):
+    runs = []
+    for d in days:
+        if runs and d - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = d
+        else:
+            runs.append([d, d])
+    return [tuple(r) for r in runs]
+
+
+def _month_chunks(start_date: date, end_date: date):
+    """Split [start_date, end_date] at calendar-month boundaries."""
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        next_month = (chunk_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        chunk_end = min(next_month - timedelta(days=1), end_date)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def _fetch_daily_pm25(lat: float, lon: float, start_date: date, end_date: date):
     """
+    Daily stats for one chunk; None if the request itself failed.
+    Raises DeadlineExceeded when the request deadline ran out first.
+    """
+    if expired():
+        # Queued behind other chunks until the request ran out of time.
+        raise DeadlineExceeded("open_meteo: request deadline exceeded")
     params = {
         "latitude": lat,
         "longitude": lon,
@@ -20,12 +149,18 @@ def fetch_pm25_history(lat: float, lon: float, start_date: date, end_date: date)
         "hourly": "pm2_5",
     }
 
-    resp = requests.get(OPEN_METEO_URL, params=params, timeout=10)
+    try:
+        resp = http_client.get("open_meteo", OPEN_METEO_URL, params=params)
+    except DeadlineExceeded:
+        raise
+    except requests.RequestException as e:
+        print("Open-Meteo error:", e)
+        return None
     print("Open-Meteo status:", resp.status_code)
 
     if resp.status_code != 200:
         print("Open-Meteo error:", resp.text[:200])
-        return []
+        return None
 
     data = resp.json()
     hourly = data.get("hourly", {})
@@ -35,20 +170,4 @@ def fetch_pm25_history(lat: float, lon: float, start_date: date, end_date: date)
     if not times or not pm25_values or len(times) != len(pm25_values):
         return []
 
-    daily_bucket = {}
-
-    for t, val in zip(times, pm25_values):
-        try:
-            v = float(val)
-        except (TypeError, ValueError):
-            continue
-        day = t.split("T")[0]
-        daily_bucket.setdefault(day, []).append(v)
-
-    daily = []
-    for day, vals in daily_bucket.items():
-        avg = sum(vals) / len(vals)
-        daily.append({"date": day, "pm25": round(avg, 2)})
-
-    daily.sort(key=lambda x: x["date"])
-    return daily
+    return aggregate_hourly_to_daily(times, pm25_values)
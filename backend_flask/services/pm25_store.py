@@ -0,0 +1,113 @@
+# services/pm25_store.py
+
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import date, datetime
+
+PM25_STORE_PATH = os.getenv(
+    "PM25_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "pm25_history.sqlite3"),
+)
+
+_lock = threading.Lock()
+_initialized = False
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_pm25 (
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    day TEXT NOT NULL,
+    pm25 REAL NOT NULL,
+    complete INTEGER NOT NULL,
+    PRIMARY KEY (lat, lon, day)
+)
+"""
+
+# Daily statistics added after the first schema; stores created before
+# them get the columns on startup and their old rows are re-downloaded.
+_STAT_COLUMNS = {
+    "pm25_min": "pm25Min",
+    "pm25_max": "pm25Max",
+    "pm25_p95": "pm25P95",
+    "valid_hours": "validHours",
+}
+
+
+def _connect():
+    global _initialized
+    if not _initialized:
+        with _lock:
+            if not _initialized:
+                os.makedirs(os.path.dirname(PM25_STORE_PATH), exist_ok=True)
+                with closing(sqlite3.connect(PM25_STORE_PATH)) as conn:
+                    conn.execute(_SCHEMA)
+                    info = conn.execute("PRAGMA table_info(daily_pm25)").fetchall()
+                    existing = {row[1] for row in info}
+                    for column in _STAT_COLUMNS:
+                        if column not in existing:
+                            conn.execute(f"ALTER TABLE daily_pm25 ADD COLUMN {column} REAL")
+                    conn.commit()
+                _initialized = True
+    return sqlite3.connect(PM25_STORE_PATH, timeout=5)
+
+
+def _coord(value: float):
+    return round(float(value), 4)
+
+
+def load_days(lat: float, lon: float, start_date: date, end_date: date):
+    """
+    Stored daily aggregates in [start_date, end_date] whose day had already
+    ended when they were fetched. Returns {"YYYY-MM-DD": daily entry} in the
+    shape produced by utils.aggregate_hourly_to_daily.
+    """
+    columns = ", ".join(_STAT_COLUMNS)
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            f"SELECT day, pm25, {columns} FROM daily_pm25 "
+            "WHERE lat = ? AND lon = ? AND day BETWEEN ? AND ? "
+            "AND complete = 1 AND valid_hours IS NOT NULL",
+            (_coord(lat), _coord(lon), start_date.isoformat(), end_date.isoformat()),
+        ).fetchall()
+
+    out = {}
+    for day, pm25, *stats in rows:
+        entry = {"date": day, "pm25": pm25}
+        entry.update(zip(_STAT_COLUMNS.values(), stats))
+        entry["validHours"] = int(entry["validHours"])
+        out[day] = entry
+    return out
+
+
+def save_days(lat: float, lon: float, daily):
+    """
+    Upsert `daily` (utils.aggregate_hourly_to_daily entries). Only days
+    before today (UTC) are marked complete; today's row will be
+    re-downloaded on the next call.
+    """
+    if not daily:
+        return
+    today = datetime.utcnow().date().isoformat()
+    rows = [
+        (_coord(lat), _coord(lon), e["date"], e["pm25"], int(e["date"] < today))
+        + tuple(e[field] for field in _STAT_COLUMNS.values())
+        for e in daily
+    ]
+    columns = ", ".join(_STAT_COLUMNS)
+    placeholders = ", ".join("?" * (5 + len(_STAT_COLUMNS)))
+    with closing(_connect()) as conn, _lock:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO daily_pm25 (lat, lon, day, pm25, complete, {columns}) "
+            f"VALUES ({placeholders})",
+            rows,
+        )
+        conn.commit()
+
+
+def clear():
+    """Drop every stored day (used by benchmarks to start cold)."""
+    with closing(_connect()) as conn, _lock:
+        conn.execute("DELETE FROM daily_pm25")
+        conn.commit()
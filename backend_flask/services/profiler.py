@@ -0,0 +1,238 @@
+# services/profiler.py
+
+import contextvars
+import itertools
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter, deque
+
+# Sampling period for explicitly requested profiles and for the automatic
+# watch on every profiled endpoint (coarser, so it stays cheap), in ms.
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_AUTO_INTERVAL_MS = float(os.getenv("PROFILE_AUTO_INTERVAL_MS", "20"))
+# Requests slower than this are kept in the ring buffer (0 disables).
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "1000"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "50"))
+MAX_STACK_DEPTH = 128
+
+# Frame file names are shown relative to the first of these found in them.
+_PATH_ROOTS = (
+    "site-packages" + os.sep,
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep,
+    sysconfig.get_paths()["stdlib"] + os.sep,
+)
+
+# The profile of the current request; copied onto stage workers with the
+# rest of the context by submit_in_context().
+_current = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    """
+    Stack samples of one request, taken from its own thread and from every
+    worker thread while it runs work on the request's behalf.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, label: str, interval_ms: float, trigger: str):
+        self.id = next(Profile._ids)
+        self.label = label
+        self.trigger = trigger
+        self.interval = interval_ms / 1000.0
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.samples = Counter()  # stack tuple (root first) -> samples
+        self.ticks = 0
+        self.info = {}
+        self._threads = Counter()  # thread id -> nesting depth
+        self._next = self.start
+        self._token = None
+        self._lock = threading.Lock()
+
+    def attach(self, thread_id: int):
+        with self._lock:
+            self._threads[thread_id] += 1
+
+    def detach(self, thread_id: int):
+        with self._lock:
+            self._threads[thread_id] -= 1
+            if self._threads[thread_id] <= 0:
+                del self._threads[thread_id]
+
+    def _sample(self, frames, now):
+        if now < self._next:
+            return
+        self._next = now + self.interval
+        with self._lock:
+            threads = list(self._threads)
+        self.ticks += 1
+        for thread_id in threads:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                self.samples[_stack(frame)] += 1
+
+    def call_tree(self):
+        """Nested {name, samples, self, children} nodes, heaviest first."""
+        root = {"name": "<request>", "samples": 0, "self": 0, "children": {}}
+        for stack, count in self.samples.items():
+            node = root
+            node["samples"] += count
+            for name in stack:
+                node = node["children"].setdefault(
+                    name, {"name": name, "samples": 0, "self": 0, "children": {}}
+                )
+                node["samples"] += count
+            node["self"] += count
+        return _sorted_tree(root)
+
+    def collapsed(self):
+        """Brendan Gregg's folded-stack text, for flamegraph.pl / speedscope."""
+        return "".join(
+            ";".join(stack) + f" {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def summary(self):
+        return {
+            "id": self.id,
+            "label": self.label,
+            "trigger": self.trigger,
+            "startedAt": self.started_at,
+            "durationMs": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "intervalMs": self.interval * 1000,
+            "ticks": self.ticks,
+            "samples": sum(self.samples.values()),
+            **self.info,
+        }
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    path = code.co_filename
+    for marker in _PATH_ROOTS:
+        idx = path.find(marker)
+        if idx >= 0:
+            path = path[idx + len(marker):]
+            break
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+def _sorted_tree(node):
+    children = sorted(node["children"].values(), key=lambda n: n["samples"], reverse=True)
+    node["children"] = [_sorted_tree(c) for c in children]
+    return node
+
+
+class _Sampler:
+    """One daemon thread sampling every active profile; idle when there is none."""
+
+    def __init__(self):
+        self._active = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, profile: Profile):
+        with self._cond:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def remove(self, profile: Profile):
+        with self._cond:
+            self._active.discard(profile)
+
+    def _loop(self):
+        me = threading.get_ident()
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                profiles = list(self._active)
+            interval = min(p.interval for p in profiles)
+            frames = sys._current_frames()
+            frames.pop(me, None)
+            now = time.perf_counter()
+            for profile in profiles:
+                profile._sample(frames, now)
+            del frames
+            time.sleep(interval)
+
+
+_sampler = _Sampler()
+
+# Recent slow / requested profiles, newest last.
+_recent = deque(maxlen=PROFILE_BUFFER_SIZE)
+_recent_lock = threading.Lock()
+
+
+def start_profile(label: str, requested: bool = False):
+    """
+    Start sampling the current request. Requested profiles sample at
+    PROFILE_INTERVAL_MS and are always kept; otherwise the request is
+    watched at PROFILE_AUTO_INTERVAL_MS and kept only if it turns out slow.
+    Returns None when neither applies.
+    """
+    if requested:
+        profile = Profile(label, PROFILE_INTERVAL_MS, "requested")
+    elif PROFILE_SLOW_MS > 0:
+        profile = Profile(label, PROFILE_AUTO_INTERVAL_MS, "slow")
+    else:
+        return None
+    profile.attach(threading.get_ident())
+    profile._token = _current.set(profile)
+    _sampler.add(profile)
+    return profile
+
+
+def finish_profile(profile: Profile):
+    """Stop sampling; returns True when the profile was kept in the buffer."""
+    _sampler.remove(profile)
+    profile.duration = time.perf_counter() - profile.start
+    profile.detach(threading.get_ident())
+    _current.reset(profile._token)
+
+    keep = profile.trigger == "requested" or profile.duration * 1000 >= PROFILE_SLOW_MS
+    if keep:
+        with _recent_lock:
+            _recent.append(profile)
+    return keep
+
+
+def run_attached(fn, *args, **kwargs):
+    """Run fn with the calling worker thread counted as part of the current profile."""
+    profile = _current.get()
+    if profile is None:
+        return fn(*args, **kwargs)
+    thread_id = threading.get_ident()
+    profile.attach(thread_id)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profile.detach(thread_id)
+
+
+def recent_profiles():
+    with _recent_lock:
+        return list(_recent)
+
+
+def get_profile(profile_id: int):
+    with _recent_lock:
+        for profile in _recent:
+            if profile.id == profile_id:
+                return profile
+    return None
@@ -0,0 +1,40 @@
+# services/rate_limit.py
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` calls per second on average, with
+    bursts of up to `burst` calls. acquire() blocks until a token is free.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = None):
+        """
+        Take a token, waiting as long as needed. With a `timeout` (seconds)
+        gives up without taking one once the wait would exceed it, and
+        returns False.
+        """
+        give_up = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if give_up is not None and now + wait > give_up:
+                return False
+            time.sleep(wait)
@@ -0,0 +1,52 @@
+# services/report_cache.py
+
+import hashlib
+import os
+
+from services.cache import TTLCache, dependencies_current
+
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "300"))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "256"))
+
+# Serialized /api/eco-report bodies per (city_key, window, response options).
+_reports = TTLCache(REPORT_CACHE_MAX_ENTRIES)
+
+
+def report_key(city_key: str, start_date, end_date, *options):
+    """`options` are anything else that changes the payload (window label, maxPoints, ...)."""
+    return ("eco_report", city_key, start_date.isoformat(), end_date.isoformat()) + options
+
+
+def get_report(key):
+    """
+    Cached {"body", "etag", "deps"} for `key`, or None when missing, expired
+    or built from source data that has been refreshed since.
+    """
+    found, entry = _reports.get(key)
+    if not found:
+        return None
+    if not dependencies_current(entry["deps"]):
+        _reports.discard(key)
+        return None
+    return entry
+
+
+def put_report(key, body: bytes, deps, store: bool = True, pending: bool = False):
+    """
+    Wrap a serialized report with a strong content ETag and cache it
+    (unless `store` is False, e.g. for reports built from degraded data).
+    `pending` marks a report with sections that missed the deadline.
+    """
+    entry = {
+        "body": body,
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+        "deps": dict(deps),
+        "pending": pending,
+    }
+    if store:
+        _reports.set(key, entry, REPORT_CACHE_TTL)
+    return entry
+
+
+def report_cache_stats():
+    return _reports.stats()
@@ -0,0 +1,120 @@
+# services/scheduler.py
+
+import heapq
+import os
+import random
+import threading
+import time
+
+from config.cities import CITY_CONFIG, canonical_city_keys
+from services.cache import refreshing
+from services.open_meteo_service import fetch_pm25_history
+from services.tomtom_service import fetch_tomtom_corridors
+from services.utils import compute_time_window
+from services.waqi_service import fetch_waqi_city_data
+
+# Seconds between refreshes of one city's data, per source. Keep them below
+# the cache TTL + stale grace so requests are always served from cache.
+REFRESH_INTERVALS = {
+    "waqi": int(os.getenv("WAQI_REFRESH_INTERVAL", "600")),
+    "open_meteo": int(os.getenv("OPEN_METEO_REFRESH_INTERVAL", "1800")),
+    "tomtom": int(os.getenv("TOMTOM_REFRESH_INTERVAL", "300")),
+}
+
+# Minimum gap between two refresh jobs, so warm-up and steady state never
+# burst against provider rate limits.
+REFRESH_MIN_GAP = float(os.getenv("REFRESH_MIN_GAP", "1.0"))
+
+# Ranges offered by the frontend; their history windows are kept warm.
+WARM_RANGES = ("7days", "15days", "30days")
+
+
+def _refresh_waqi(city_key):
+    fetch_waqi_city_data(CITY_CONFIG[city_key]["waqiName"])
+
+
+def _refresh_open_meteo(city_key):
+    lat, lon = CITY_CONFIG[city_key]["coords"]
+    for range_str in WARM_RANGES:
+        _from, _to, start_date, end_date, _label, _days = compute_time_window(range_str)
+        fetch_pm25_history(lat, lon, start_date, end_date)
+
+
+def _refresh_tomtom(city_key):
+    fetch_tomtom_corridors(city_key, radius_km=10.0)
+
+
+REFRESHERS = {
+    "waqi": _refresh_waqi,
+    "open_meteo": _refresh_open_meteo,
+    "tomtom": _refresh_tomtom,
+}
+
+
+class RefreshScheduler:
+    """
+    Keeps every (non-alias) city's upstream data warm in the shared cache.
+
+    Jobs are (city, source) pairs on a single timeline: the first pass is
+    staggered by REFRESH_MIN_GAP, and each job is then re-queued after its
+    source's interval (±10% jitter), so refreshes stay spread out.
+    Requests meanwhile get fresh or stale-while-revalidate values from the
+    cache and never wait on the scheduler.
+    """
+
+    def __init__(self, city_keys=None, intervals=None, min_gap=REFRESH_MIN_GAP):
+        self.city_keys = city_keys or canonical_city_keys()
+        self.intervals = intervals or REFRESH_INTERVALS
+        self.min_gap = min_gap
+        self._queue = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        now = time.monotonic()
+        jobs = [(c, s) for s in self.intervals for c in self.city_keys]
+        for i, (city_key, source) in enumerate(jobs):
+            heapq.heappush(self._queue, (now + i * self.min_gap, city_key, source))
+
+        self._thread = threading.Thread(
+            target=self._run, name="refresh-scheduler", daemon=True
+        )
+        self._thread.start()
+        print(f"Refresh scheduler started: {len(jobs)} jobs")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            due, city_key, source = self._queue[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                self._stop.wait(min(wait, 5.0))
+                continue
+
+            heapq.heappop(self._queue)
+            try:
+                with refreshing():
+                    REFRESHERS[source](city_key)
+            except Exception as e:
+                print(f"Refresh {source} {city_key} failed:", e)
+
+            interval = self.intervals[source]
+            next_due = time.monotonic() + interval * random.uniform(0.9, 1.1)
+            heapq.heappush(self._queue, (next_due, city_key, source))
+            self._stop.wait(self.min_gap)
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    """Start the process-wide scheduler once (the cache it warms is in-process)."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RefreshScheduler()
+        _scheduler.start()
+    return _scheduler
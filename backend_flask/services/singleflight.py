@@ -0,0 +1,62 @@
+# services/singleflight.py
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs
+    `fn`, everyone who arrives while it is in flight waits and gets the
+    same result (or the same exception).
+
+    A waiting caller may pass `redo(result, error)`: when it returns True
+    for the shared outcome (e.g. a load cut short by the leader's tighter
+    deadline while this caller still has time) the caller runs the call
+    again, joining a newer flight for the key if one has started.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0  # callers that shared another caller's result
+
+    def do(self, key, fn, redo=None):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            call.done.wait()
+            if redo is not None and redo(call.result, call.error):
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,70 @@
+# services/stages.py
+
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from services.metrics import record_stage
+from services.profiler import run_attached
+
+STAGE_MAX_WORKERS = int(os.getenv("STAGE_MAX_WORKERS", "8"))
+
+# One bounded pool shared by every request; stages only wait on network I/O.
+_pool = ThreadPoolExecutor(max_workers=STAGE_MAX_WORKERS, thread_name_prefix="stage")
+
+
+def submit_in_context(pool, fn, *args, **kwargs):
+    """
+    pool.submit() that runs `fn` inside a copy of the caller's contextvars,
+    so per-request state (e.g. cache dependency tracking, the request's
+    profile) follows the work onto worker threads.
+    """
+    ctx = contextvars.copy_context()
+    return pool.submit(ctx.run, run_attached, fn, *args, **kwargs)
+
+
+class StageExecutor:
+    """
+    Runs the independent fetch stages of one request in parallel and
+    records how long each stage took (ms) in `timings`, the stage
+    histogram and the request's Server-Timing header.
+
+        stages = StageExecutor()
+        stages.submit("waqi", fetch_waqi_city_data, "Delhi")
+        stages.submit("history", fetch_pm25_history, lat, lon, start, end)
+        results = stages.join()
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor = None):
+        self._pool = pool or _pool
+        self._futures = {}
+        self.timings = {}
+        self.pending = []
+
+    def submit(self, name: str, fn, *args, **kwargs):
+        self._futures[name] = submit_in_context(
+            self._pool, self._timed, name, fn, *args, **kwargs
+        )
+
+    def join(self, timeout: float = None):
+        """
+        Wait for every submitted stage; re-raises the first stage error.
+        With a `timeout` (seconds), stages still running after it are left
+        out of the result and listed in `pending`; those that never got a
+        worker are cancelled so they don't hold up other requests.
+        """
+        done, not_done = wait(self._futures.values(), timeout=timeout)
+        for fut in not_done:
+            fut.cancel()
+        self.pending = [name for name, fut in self._futures.items() if fut not in done]
+        return {name: fut.result() for name, fut in self._futures.items() if fut in done}
+
+    def _timed(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = round(seconds * 1000, 1)
+            record_stage(name, seconds)
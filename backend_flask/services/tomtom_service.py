@@ -129,15 +129,52 @@
 
 # services/tomtom_service.py
 
+import math
 import os
 import random
-import requests
+from concurrent.futures import ThreadPoolExecutor
+
 from dotenv import load_dotenv
 from config.cities import CITY_CONFIG
+from services import http_client
+from services.cache import cached_call, make_key
+from services.circuit_breaker import mark_degraded
+from services.deadline import DeadlineExceeded, expired
+from services.stages import submit_in_context
+from services.upstream_archive import UPSTREAM_MODE
+from services.utils import geohash_encode
 
 load_dotenv()
 TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
 
+# Base URL is overridable so benchmarks can point at a local stub.
+TOMTOM_BASE_URL = os.getenv("TOMTOM_BASE_URL", "https://api.tomtom.com").rstrip("/")
+TOMTOM_FLOW_URL = f"{TOMTOM_BASE_URL}/traffic/services/4/flowSegmentData/absolute/10/json"
+
+# Max flowSegmentData calls in flight at once (shared by all requests).
+TOMTOM_MAX_CONCURRENCY = int(os.getenv("TOMTOM_MAX_CONCURRENCY", "8"))
+
+# Sample points per city (clamped to 6–200); calls are paced by
+# TOMTOM_RATE_LIMIT / TOMTOM_RATE_BURST in http_client. The defaults are
+# sized together with REPORT_DEADLINE_MS (1.5 s): a cold city costs 12
+# tokens, the burst of 100 covers ~8 cold cities at once without waiting
+# and 50/s refills ~4 per second. Raise the budget only together with the
+# rate limit, or cold reports will miss their deadline on the limiter.
+TOMTOM_POINT_BUDGET = int(os.getenv("TOMTOM_POINT_BUDGET", "12"))
+
+# Flow segments are cached per geohash cell (7 ≈ 150 m), so nearby sample
+# points from any city / radius reuse one lookup.
+TOMTOM_GEOHASH_PRECISION = int(os.getenv("TOMTOM_GEOHASH_PRECISION", "7"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=TOMTOM_MAX_CONCURRENCY, thread_name_prefix="tomtom"
+)
+
+COMPASS = [
+    "North", "North-East", "East", "South-East",
+    "South", "South-West", "West", "North-West",
+]
+
 
 # --------------------------------------------
 # Realistic fallback settings for each city
@@ -173,9 +210,25 @@ CITY_BASE_AQI = {
 }
 
 
-def generate_realistic_congestion(city_key):
+# Synthetic congestion values are random unless TOMTOM_FALLBACK_SEED is set
+# (record / replay modes default it to 0). Seeded, each point draws from its
+# own RNG keyed by (seed, city, point), so results don't depend on thread
+# timing.
+TOMTOM_FALLBACK_SEED = os.getenv("TOMTOM_FALLBACK_SEED") or (
+    "0" if UPSTREAM_MODE != "live" else None
+)
+_fallback_rng = random.Random()
+
+
+def _fallback_rng_for(city_key, point):
+    if TOMTOM_FALLBACK_SEED is None or point is None:
+        return _fallback_rng
+    return random.Random(f"{TOMTOM_FALLBACK_SEED}:{city_key}:{point[0]:.5f},{point[1]:.5f}")
+
+
+def generate_realistic_congestion(city_key, point=None):
     low, high = CITY_CONGESTION_RANGE.get(city_key, (40, 70))
-    return round(random.uniform(low, high), 1)
+    return round(_fallback_rng_for(city_key, point).uniform(low, high), 1)
 
 
 def generate_realistic_emissions(city_key, congestion):
@@ -189,10 +242,134 @@ def fallback_aqi(city_key, congestion):
     return min(500, max(0, round(base + congestion * 0.8)))
 
 
-def fetch_tomtom_corridors(city_key: str, radius_km: float, city_aqi):
-    """Fetch real TomTom data. Fix or replace broken values with realistic ones."""
+def corridor_sample_points(lat: float, lon: float, radius_km: float, budget: int):
+    """
+    Spread `budget` points over concentric rings out to `radius_km`: ring r
+    of R gets a share proportional to its radius and is rotated half a step
+    against the previous ring, so coverage is roughly hexagonal.
+    Returns list[(lat, lon, label)].
+    """
+    budget = max(6, min(200, int(budget)))
+    rings = max(1, round(math.sqrt(budget / 3)))
+    weight = rings * (rings + 1) / 2
+
+    counts = [max(1, round(budget * r / weight)) for r in range(1, rings + 1)]
+    counts[-1] = max(1, budget - sum(counts[:-1]))
+
+    km_per_deg_lat = 111.32
+    km_per_deg_lon = 111.32 * math.cos(math.radians(lat))
+
+    points = []
+    for r, count in enumerate(counts, start=1):
+        dist_km = radius_km * r / rings
+        for i in range(count):
+            bearing = 360.0 * (i + 0.5 * (r % 2 == 0)) / count
+            rad = math.radians(bearing)
+            point_lat = lat + dist_km * math.cos(rad) / km_per_deg_lat
+            point_lon = lon + dist_km * math.sin(rad) / km_per_deg_lon
+            label = f"{COMPASS[int(bearing / 45 + 0.5) % 8]} {dist_km:.0f} km"
+            if count > len(COMPASS):  # several points per compass direction
+                label += f" ({bearing:.0f}°)"
+            points.append((point_lat, point_lon, label))
+    return points
+
+
+def _segment_id(seg):
+    """Identity of the road segment TomTom snapped a point to (None if unknown)."""
+    coords = (seg.get("coordinates") or {}).get("coordinate") or []
+    if not coords:
+        return None
+    first, last = coords[0], coords[-1]
+    return (
+        round(first.get("latitude", 0), 5), round(first.get("longitude", 0), 5),
+        round(last.get("latitude", 0), 5), round(last.get("longitude", 0), 5),
+        seg.get("frc"),
+    )
+
+
+def _fetch_flow_segment(point_lat, point_lon, label):
+    """Raw flowSegmentData for one point, or None on a non-200 response."""
+    params = {
+        "key": TOMTOM_API_KEY,
+        "point": f"{point_lat:.6f},{point_lon:.6f}",
+    }
+
+    resp = http_client.get("tomtom", TOMTOM_FLOW_URL, params=params)
+    print(f"TomTom {label}: {resp.status_code}")
+
+    if resp.status_code != 200:
+        return None
+    return resp.json().get("flowSegmentData", {})
+
+
+def _fetch_corridor_point(city_key, cfg, idx, label, point_lat, point_lon):
+    """
+    One flowSegmentData lookup; falls back to realistic values when TomTom
+    fails. A missed request deadline is not a TomTom failure: it raises
+    DeadlineExceeded so the caller can report the section as pending.
+    """
+    point = (point_lat, point_lon)
+    segment = None
+    try:
+        if expired():
+            # Queued behind other points until the request ran out of time.
+            raise DeadlineExceeded("tomtom: request deadline exceeded")
+        cell = geohash_encode(point_lat, point_lon, TOMTOM_GEOHASH_PRECISION)
+        seg = cached_call(
+            make_key("tomtom", cell=cell),
+            lambda: _fetch_flow_segment(
+                point_lat, point_lon, f"{cfg['waqiName']} {label}"
+            ),
+            cacheable=lambda s: s is not None,
+        )
+
+        if seg is None:
+            mark_degraded("tomtom", "synthetic")
+            congestion = generate_realistic_congestion(city_key, point)
+        else:
+            segment = _segment_id(seg)
+            cur = seg.get("currentSpeed")
+            free = seg.get("freeFlowSpeed")
+
+            # TomTom gives broken values often → fix them
+            if not cur or not free or free == 0:
+                congestion = generate_realistic_congestion(city_key, point)
+            else:
+                congestion = round(100 * (1 - cur / free), 1)
+                if congestion <= 2:  # still unrealistic
+                    congestion = generate_realistic_congestion(city_key, point)
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        print("TomTom error:", e)
+        mark_degraded("tomtom", "synthetic")
+        congestion = generate_realistic_congestion(city_key, point)
 
-    if not TOMTOM_API_KEY:
+    emissions = generate_realistic_emissions(city_key, congestion)
+
+    return {
+        "id": idx,
+        "name": f"{cfg['waqiName']} {label} Corridor",
+        "issue": "Traffic Congestion",
+        "congestionPercent": congestion,
+        "dailyEmissionsTons": emissions,
+        "aqi": None,  # filled in app.py
+        "centerLat": point_lat,
+        "centerLon": point_lon,
+        "_segment": segment,  # dropped after de-duplication
+    }
+
+
+def fetch_tomtom_corridors(
+    city_key: str, radius_km: float, city_aqi=None, point_budget: int = None
+):
+    """
+    Fetch real TomTom data for `point_budget` points spread over
+    `radius_km`. Fix or replace broken values with realistic ones.
+    """
+
+    if not TOMTOM_API_KEY and UPSTREAM_MODE != "replay":
         print("⚠️ Missing TomTom API key — returning empty data")
         return {"corridors": [], "stats": {"avgCongestion": None, "maxCongestion": None}}
 
@@ -201,76 +378,46 @@ def fetch_tomtom_corridors(city_key: str, radius_km: float, city_aqi):
         return {"corridors": [], "stats": {"avgCongestion": None, "maxCongestion": None}}
 
     lat, lon = cfg["coords"]
-
-    offsets = [
-        (0.06, 0.00, "North"),
-        (-0.06, 0.00, "South"),
-        (0.00, 0.08, "East"),
-        (0.00, -0.08, "West"),
-        (0.04, 0.06, "North-East"),
-        (-0.04, -0.06, "South-West"),
+    points = corridor_sample_points(
+        lat, lon, radius_km, point_budget or TOMTOM_POINT_BUDGET
+    )
+
+    # All points go out at once over the shared keep-alive pool (paced by the
+    # provider-wide rate limit), so the stage costs a few round trips
+    # instead of one per point.
+    futures = [
+        submit_in_context(
+            _executor,
+            _fetch_corridor_point,
+            city_key, cfg, idx, label, point_lat, point_lon,
+        )
+        for idx, (point_lat, point_lon, label) in enumerate(points, start=1)
     ]
 
-    url = "https://api.tomtom.com/traffic/services/4/flowSegmentData/absolute/10/json"
-    corridors = []
-
-    for idx, (dlat, dlon, label) in enumerate(offsets, start=1):
-        point_lat = lat + dlat
-        point_lon = lon + dlon
-
-        params = {
-            "key": TOMTOM_API_KEY,
-            "point": f"{point_lat:.6f},{point_lon:.6f}",
-        }
-
+    results = []
+    cut_short = False
+    for f in futures:
         try:
-            resp = requests.get(url, params=params, timeout=8)
-            print(f"TomTom {cfg['waqiName']} {label}: {resp.status_code}")
+            results.append(f.result())
+        except DeadlineExceeded:
+            cut_short = True
+    if cut_short:
+        # Out of time before every point answered: the section stays empty
+        # rather than mixing in made-up corridors.
+        mark_degraded("tomtom", "pending")
+        return {"corridors": [], "stats": {"avgCongestion": None, "maxCongestion": None}}
 
-            if resp.status_code != 200:
-                congestion = generate_realistic_congestion(city_key)
-                emissions = generate_realistic_emissions(city_key, congestion)
-            else:
-                seg = resp.json().get("flowSegmentData", {})
-                cur = seg.get("currentSpeed")
-                free = seg.get("freeFlowSpeed")
-
-                # TomTom gives broken values often → fix them
-                if not cur or not free or free == 0:
-                    congestion = generate_realistic_congestion(city_key)
-                else:
-                    congestion = round(100 * (1 - cur / free), 1)
-                    if congestion <= 2:  # still unrealistic
-                        congestion = generate_realistic_congestion(city_key)
-
-                emissions = generate_realistic_emissions(city_key, congestion)
-
-            corridors.append({
-                "id": idx,
-                "name": f"{cfg['waqiName']} {label} Corridor",
-                "issue": "Traffic Congestion",
-                "congestionPercent": congestion,
-                "dailyEmissionsTons": emissions,
-                "aqi": None,  # filled in app.py
-                "centerLat": point_lat,
-                "centerLon": point_lon,
-            })
-
-        except Exception as e:
-            print("TomTom error:", e)
-            congestion = generate_realistic_congestion(city_key)
-            emissions = generate_realistic_emissions(city_key, congestion)
-
-            corridors.append({
-                "id": idx,
-                "name": f"{cfg['waqiName']} {label} Corridor",
-                "issue": "Traffic Congestion",
-                "congestionPercent": congestion,
-                "dailyEmissionsTons": emissions,
-                "aqi": None,
-                "centerLat": point_lat,
-                "centerLon": point_lon,
-            })
+    # Nearby points often snap to the same road segment → keep the first.
+    corridors = []
+    seen_segments = set()
+    for c in results:
+        segment = c.pop("_segment")
+        if segment is not None:
+            if segment in seen_segments:
+                continue
+            seen_segments.add(segment)
+        c["id"] = len(corridors) + 1
+        corridors.append(c)
 
     # compute stats
     avg_cong = sum(c["congestionPercent"] for c in corridors) / len(corridors)
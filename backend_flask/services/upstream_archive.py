@@ -0,0 +1,138 @@
+# services/upstream_archive.py
+
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# live   → call the real providers (default)
+# record → call them and append every response to UPSTREAM_ARCHIVE
+# replay → answer from UPSTREAM_ARCHIVE only (no network, no API keys)
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live").strip().lower()
+UPSTREAM_ARCHIVE = os.getenv(
+    "UPSTREAM_ARCHIVE",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "upstream.jsonl.gz"),
+)
+# "original" replays each response after its recorded latency, "none" at once.
+UPSTREAM_REPLAY_TIMING = os.getenv("UPSTREAM_REPLAY_TIMING", "original").strip().lower()
+
+if UPSTREAM_MODE not in ("live", "record", "replay"):
+    raise ValueError(f"UPSTREAM_MODE must be live, record or replay (got {UPSTREAM_MODE!r})")
+
+# Credentials are never written to the archive or used in keys.
+SECRET_PARAMS = {"token", "key"}
+
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """Replay mode has no recorded response for this request."""
+
+
+def request_key(provider: str, url: str, params=None):
+    """
+    Stable key for a request: provider + URL path + sorted params without
+    credentials (the host is left out so stub / proxy base URLs match).
+    """
+    path = requests.utils.urlparse(url).path
+    clean = sorted((k, str(v)) for k, v in (params or {}).items() if k not in SECRET_PARAMS)
+    raw = json.dumps([provider, path, clean])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class _Recorder:
+    """Appends one gzip'd JSON line per response; safe to share across threads."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def write(self, entry):
+        line = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _load_archive(path: str):
+    """{key: entry}; the last recording of a key wins."""
+    entries = {}
+    if not os.path.exists(path):
+        print(f"Upstream archive {path} not found — every replayed call will miss")
+        return entries
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["key"]] = entry
+        except EOFError:
+            pass  # recorder was killed before closing; keep what was written
+    print(f"Upstream archive: {len(entries)} recorded responses loaded")
+    return entries
+
+
+_recorder = None
+_archive = None
+_init_lock = threading.Lock()
+
+
+def record(provider: str, url: str, params, resp, elapsed: float):
+    global _recorder
+    if _recorder is None:
+        with _init_lock:
+            if _recorder is None:
+                _recorder = _Recorder(UPSTREAM_ARCHIVE)
+    _recorder.write({
+        "key": request_key(provider, url, params),
+        "provider": provider,
+        "path": requests.utils.urlparse(url).path,
+        "params": {k: v for k, v in (params or {}).items() if k not in SECRET_PARAMS},
+        "status": resp.status_code,
+        "contentType": resp.headers.get("Content-Type"),
+        "elapsed": round(elapsed, 4),
+        "body": resp.text,
+        "recordedAt": time.time(),
+    })
+
+
+def replay(provider: str, url: str, params, timeout):
+    """
+    Recorded response for the request as a requests.Response, after its
+    original latency when UPSTREAM_REPLAY_TIMING is "original" (a latency
+    beyond the read timeout raises ReadTimeout, as the real call would).
+    """
+    global _archive
+    if _archive is None:
+        with _init_lock:
+            if _archive is None:
+                _archive = _load_archive(UPSTREAM_ARCHIVE)
+
+    entry = _archive.get(request_key(provider, url, params))
+    if entry is None:
+        raise ReplayMissError(f"{provider}: no recorded response for {url}")
+
+    if UPSTREAM_REPLAY_TIMING == "original":
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and entry["elapsed"] > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout(f"{provider}: replayed response too slow")
+        time.sleep(entry["elapsed"])
+
+    resp = requests.Response()
+    resp.status_code = entry["status"]
+    resp._content = entry["body"].encode("utf-8")
+    resp.encoding = "utf-8"
+    resp.headers = CaseInsensitiveDict({"Content-Type": entry.get("contentType") or "application/json"})
+    resp.url = url
+    return resp
@@ -1,29 +1,61 @@
 # services/utils.py
 
 from datetime import datetime, timedelta, date
+import bisect
 import math
 
+import numpy as np
 
-def compute_time_window(range_str: str):
-    """Return (from_iso, to_iso, start_date, end_date, label, days)."""
+
+# Longest window accepted for custom from/to ranges.
+MAX_WINDOW_DAYS = 730
+
+RANGE_DAYS = {
+    "7days": 7, "7d": 7,
+    "15days": 15, "15d": 15,
+    "30days": 30, "30d": 30,
+    "90days": 90, "90d": 90,
+    "365days": 365, "365d": 365,
+}
+
+
+def compute_time_window(range_str: str, date_from: str = None, date_to: str = None):
+    """
+    Return (from_iso, to_iso, start_date, end_date, label, days).
+
+    `date_from` / `date_to` ("YYYY-MM-DD") select a custom window and take
+    precedence over `range_str`; `date_to` defaults to today and is capped
+    at today. Raises ValueError for an unknown `range_str`, for malformed or
+    out-of-bounds custom dates, and for a `date_to` without a `date_from`.
+    """
     now = datetime.utcnow()
     today = now.date()
 
-    if range_str in ("7days", "7d"):
-        days = 7
-        label = "Last 7 days"
-    elif range_str in ("15days", "15d"):
-        days = 15
-        label = "Last 15 days"
-    elif range_str in ("30days", "30d"):
-        days = 30
-        label = "Last 30 days"
-    else:
-        days = 7
-        label = "Last 7 days"
+    if date_to and not date_from:
+        raise ValueError("'to' requires 'from'")
 
-    start_date = today - timedelta(days=days - 1)
-    end_date = today
+    if date_from:
+        try:
+            start_date = date.fromisoformat(date_from)
+            end_date = min(date.fromisoformat(date_to), today) if date_to else today
+        except (TypeError, ValueError):
+            raise ValueError("'from' / 'to' must be dates in YYYY-MM-DD format")
+        if start_date > end_date:
+            raise ValueError("'from' must not be after 'to'")
+        days = (end_date - start_date).days + 1
+        if days > MAX_WINDOW_DAYS:
+            raise ValueError(f"Window longer than {MAX_WINDOW_DAYS} days")
+        label = f"{start_date.isoformat()} → {end_date.isoformat()}"
+    else:
+        days = RANGE_DAYS.get(range_str)
+        if days is None:
+            raise ValueError(
+                f"Unknown range {range_str!r}; use one of: "
+                + ", ".join(k for k in RANGE_DAYS if k.endswith("days"))
+            )
+        label = f"Last {days} days"
+        start_date = today - timedelta(days=days - 1)
+        end_date = today
 
     time_from = datetime.combine(start_date, datetime.min.time()).isoformat() + "Z"
     time_to = datetime.combine(end_date, datetime.max.time()).isoformat() + "Z"
@@ -31,6 +63,38 @@ def compute_time_window(range_str: str):
     return time_from, time_to, start_date, end_date, label, days
 
 
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 7):
+    """
+    Standard base32 geohash of (lat, lon). Precision 6 ≈ 1.2 × 0.6 km,
+    7 ≈ 153 × 153 m, 8 ≈ 38 × 19 m.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # bits alternate lon, lat, lon, ...
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
 def compute_aqi_from_pm25(pm25):
     """Rough India-style AQI mapping from PM2.5 µg/m³."""
     if pm25 is None:
@@ -99,3 +163,160 @@ def compute_pollution_breakdown(pm25, pm10, no2):
         "construction": round(construction, 2),
         "others": round(others, 2),
     }
+
+
+def apply_corridor_aqi(corridors, city_aqi, avg_congestion):
+    """
+    Set each corridor's local "aqi" from the city AQI and how congested it
+    is relative to the average (+/- 50% congestion → +/- 30 AQI points).
+    Without a city AQI every corridor gets the 100 fallback.
+    """
+    if city_aqi is None:
+        for c in corridors:
+            c["aqi"] = 100
+        return
+
+    base_aqi = float(city_aqi)
+    avg_cong = avg_congestion or 0.0
+    for c in corridors:
+        diff = c["congestionPercent"] - avg_cong
+        local_aqi = base_aqi + (diff / 50.0) * 30.0
+        c["aqi"] = max(0, min(500, round(local_aqi)))
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def aggregate_hourly_to_daily(times, values):
+    """
+    Aggregate hourly PM2.5 ("YYYY-MM-DDTHH:MM" times) into per-day stats,
+    ignoring missing / non-numeric hours. Returns, sorted by date:
+    list[{ "date", "pm25" (mean), "pm25Min", "pm25Max", "pm25P95", "validHours" }]
+    """
+    if len(times) == 0:
+        return []
+
+    t = np.asarray(times, dtype="U16")
+    try:
+        v = np.array(values, dtype=float)  # None → NaN
+    except (TypeError, ValueError):
+        v = np.array([_to_float(x) for x in values], dtype=float)
+    order = np.argsort(t, kind="stable")
+    days, starts, counts = np.unique(
+        t[order].astype("U10"), return_index=True, return_counts=True
+    )
+
+    # One NaN-padded row per day, sorted so each row's `valid` readings come
+    # first (NaN sorts last); min / max / p95 are then plain lookups, which
+    # is far cheaper than np.nan* reductions on rows containing NaN.
+    day_idx = np.repeat(np.arange(len(days)), counts)
+    slot = np.arange(len(t)) - starts[day_idx]
+    grid = np.full((len(days), counts.max()), np.nan)
+    grid[day_idx, slot] = v[order]
+    grid.sort(axis=1)
+
+    valid = np.count_nonzero(~np.isnan(grid), axis=1)
+    keep = valid > 0
+    grid, days, valid = grid[keep], days[keep], valid[keep]
+    if len(days) == 0:
+        return []
+
+    rows = np.arange(len(days))
+    total = np.where(np.isnan(grid), 0.0, grid).sum(axis=1)
+    mean = np.round(total / valid, 2)
+    low = np.round(grid[:, 0], 2)
+    high = np.round(grid[rows, valid - 1], 2)
+
+    # Linear-interpolated 95th percentile (numpy's default method).
+    pos = (valid - 1) * 0.95
+    below = np.floor(pos).astype(int)
+    above = np.minimum(below + 1, valid - 1)
+    lo_v, hi_v = grid[rows, below], grid[rows, above]
+    p95 = np.round(lo_v + (hi_v - lo_v) * (pos - below), 2)
+
+    return [
+        {
+            "date": d,
+            "pm25": m,
+            "pm25Min": lo,
+            "pm25Max": hi,
+            "pm25P95": p,
+            "validHours": n,
+        }
+        for d, m, lo, hi, p, n in zip(
+            days.tolist(), mean.tolist(), low.tolist(), high.tolist(),
+            p95.tolist(), valid.tolist(),
+        )
+    ]
+
+
+def downsample_lttb(values, max_points: int):
+    """
+    Largest-Triangle-Three-Buckets: indices (sorted) of at most `max_points`
+    samples of `values` that preserve the visual shape of the series. The
+    first, last, global max and global min samples are always kept.
+    Missing values (None / NaN) are never picked over a real reading.
+    """
+    try:
+        y = [float(v) for v in values]
+    except (TypeError, ValueError):
+        y = [_to_float(v) for v in values]
+    n = len(y)
+    if max_points >= n or max_points < 4:  # 4 = first, last, max, min
+        return list(range(n))
+
+    # Inner buckets [edges[i], edges[i + 1]); the last point is its own.
+    step = (n - 2) / (max_points - 2)
+    edges = [int(1 + k * step) for k in range(max_points - 1)]
+    edges[-1] = n - 1
+    bounds = list(zip(edges, edges[1:])) + [(n - 1, n)]
+
+    # Mean point of every bucket, in one pass over the series.
+    means = []
+    for lo, hi in bounds:
+        ys = y[lo:hi]
+        total = sum(ys)
+        if total != total:  # NaN: average the readings that exist
+            ys = [v for v in ys if v == v]
+            total = sum(ys)
+        means.append(((lo + hi - 1) / 2, total / len(ys) if ys else math.nan))
+
+    # Each bucket keeps the point spanning the largest triangle with the
+    # previous pick and the next bucket's mean. NaN areas never compare
+    # greater, so a bucket with no usable area falls back to its first point.
+    selected = [0]
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = bounds[i]
+        avg_x, avg_y = means[i + 1]
+        ya = y[a]
+        dx, dy = a - avg_x, avg_y - ya
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs(dx * (y[j] - ya) - (a - j) * dy)
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected.append(a)
+    selected.append(n - 1)
+
+    # Peaks must survive: swap each extreme in for the pick of its bucket
+    # (or a neighbouring bucket's, if both extremes share one).
+    finite = [i for i in range(n) if y[i] == y[i]]
+    if not finite:
+        return sorted(set(selected))
+    extremes = (max(finite, key=y.__getitem__), min(finite, key=y.__getitem__))
+    for extreme in extremes:
+        if extreme in selected:
+            continue
+        bucket = bisect.bisect_right(edges, extreme) - 1
+        slot = min(max(bucket, 0), max_points - 3) + 1
+        if selected[slot] in extremes:
+            slot = slot + 1 if slot + 1 < max_points - 1 else slot - 1
+        selected[slot] = extreme
+
+    return sorted(set(selected))
@@ -4,19 +4,26 @@ import os
 import requests
 from dotenv import load_dotenv
 
+from services import http_client
+from services.cache import cached_call, make_key
+from services.upstream_archive import UPSTREAM_MODE
+
 load_dotenv()
 
 WAQ_API_KEY = os.getenv("WAQ_API_KEY")
 
+# Base URL is overridable so benchmarks can point at a local stub.
+WAQI_BASE_URL = os.getenv("WAQI_BASE_URL", "https://api.waqi.info").rstrip("/")
 
-def fetch_waqi_city_data(waqi_city_name: str):
-    if not WAQ_API_KEY:
-        return {"error": "Missing WAQ_API_KEY in environment"}
 
-    url = f"https://api.waqi.info/feed/{waqi_city_name}/"
+def _fetch_feed(waqi_city_name: str):
+    url = f"{WAQI_BASE_URL}/feed/{waqi_city_name}/"
     params = {"token": WAQ_API_KEY}
 
-    resp = requests.get(url, params=params, timeout=10)
+    try:
+        resp = http_client.get("waqi", url, params=params)
+    except requests.RequestException as e:
+        return {"error": f"WAQI request failed: {e}"}
     print("WAQI status:", resp.status_code)
 
     if resp.status_code != 200:
@@ -26,6 +33,23 @@ def fetch_waqi_city_data(waqi_city_name: str):
     if payload.get("status") != "ok":
         return {"error": f"WAQI error: {payload.get('data')}"}
 
+    return payload
+
+
+def fetch_waqi_city_data(waqi_city_name: str):
+    if not WAQ_API_KEY and UPSTREAM_MODE != "replay":
+        return {"error": "Missing WAQ_API_KEY in environment"}
+
+    # Cache the raw feed; the dicts below are rebuilt per call because
+    # app.py adjusts pollutants["aqi"] in place.
+    payload = cached_call(
+        make_key("waqi", city=waqi_city_name),
+        lambda: _fetch_feed(waqi_city_name),
+        cacheable=lambda p: "error" not in p,
+    )
+    if "error" in payload:
+        return payload
+
     data = payload.get("data", {})
     iaqi = data.get("iaqi", {})
 
@@ -0,0 +1,180 @@
+# Run from backend_flask/: python -m pytest tests
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+os.environ.setdefault("WAQ_API_KEY", "test")
+os.environ.setdefault("TOMTOM_API_KEY", "test")
+os.environ.setdefault("ENABLE_REFRESH_SCHEDULER", "0")
+os.environ.setdefault("PM25_STORE_PATH", os.path.join(tempfile.mkdtemp(), "pm25.sqlite3"))
+
+import pytest
+import requests
+
+import app as app_module
+from services import http_client, pm25_store
+from services.cache import _cache
+from services.report_cache import _reports
+from services.singleflight import SingleFlight
+
+
+class _Resp:
+    def __init__(self, body):
+        self.status_code = 200
+        self._body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+
+def _body(provider, params):
+    if provider == "waqi":
+        return {"status": "ok", "data": {
+            "aqi": 120, "iaqi": {"pm25": {"v": 80}, "pm10": {"v": 90}, "no2": {"v": 30}},
+            "city": {"name": "Test"},
+        }}
+    if provider == "open_meteo":
+        start = datetime.fromisoformat(params["start_date"])
+        hours = ((datetime.fromisoformat(params["end_date"]) - start).days + 1) * 24
+        times = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]
+        return {"hourly": {"time": times, "pm2_5": [40.0] * hours}}
+    lat = float(params["point"].split(",")[0])
+    return {"flowSegmentData": {
+        "currentSpeed": 20, "freeFlowSpeed": 40,
+        "coordinates": {"coordinate": [{"latitude": lat, "longitude": 1.0}]},
+    }}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake provider sessions: counts calls, answers after `latency` seconds."""
+    calls = Counter()
+    lock = threading.Lock()
+    latency = {"seconds": 0.1}
+
+    def fake(provider):
+        def get(url, params=None, timeout=None, **kwargs):
+            with lock:
+                calls[provider] += 1
+            read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+            if read_timeout is not None and latency["seconds"] > read_timeout:
+                time.sleep(read_timeout)
+                raise requests.ReadTimeout("slow stub")
+            time.sleep(latency["seconds"])
+            return _Resp(_body(provider, params))
+        return get
+
+    for provider, session in http_client._sessions.items():
+        monkeypatch.setattr(session, "get", fake(provider))
+    _cache.clear()
+    _reports.clear()
+    pm25_store.clear()
+    yield calls, latency
+    _cache.clear()
+    _reports.clear()
+
+
+def _concurrent_reports(query, n):
+    client = app_module.app.test_client()
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(lambda _: client.get(f"/api/eco-report?{query}"), range(n)))
+
+
+@pytest.mark.parametrize("query", ["city=mumbai", "city=mumbai&deadlineMs=30000"])
+def test_concurrent_reports_share_one_build(upstream, query):
+    calls, _ = upstream
+    coalesced = app_module._report_flight.coalesced
+
+    responses = _concurrent_reports(query, 10)
+
+    assert all(r.status_code == 200 for r in responses)
+    assert calls["waqi"] == 1
+    assert calls["open_meteo"] == 1
+    assert app_module._report_flight.coalesced - coalesced == 9
+
+
+def test_report_cut_short_by_tighter_deadline_is_rebuilt(upstream):
+    _, latency = upstream
+    latency["seconds"] = 0.3
+    client = app_module.app.test_client()
+    results = {}
+
+    def get(name, query):
+        results[name] = client.get(f"/api/eco-report?city=pune&{query}").json
+
+    short = threading.Thread(target=get, args=("short", "deadlineMs=150"))
+    short.start()
+    time.sleep(0.03)
+    get("long", "deadlineMs=30000")
+    short.join()
+
+    assert "pending" in results["short"]["dataQuality"]["sources"].values()
+    assert "pending" not in results["long"]["dataQuality"]["sources"].values()
+
+
+def test_singleflight_redo_reruns_for_waiting_caller():
+    flight = SingleFlight()
+    started = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append("leader")
+        started.set()
+        time.sleep(0.05)
+        return "partial"
+
+    leader = threading.Thread(target=flight.do, args=("k", slow))
+    leader.start()
+    started.wait()
+    result = flight.do("k", lambda: runs.append("again") or "full",
+                       redo=lambda r, e: r == "partial")
+    leader.join()
+
+    assert result == "full"
+    assert runs == ["leader", "again"]
+
+
+def test_deadline_miss_is_pending_not_synthetic(upstream):
+    _, latency = upstream
+    latency["seconds"] = 0.4
+
+    report = app_module.app.test_client().get(
+        "/api/eco-report?city=chennai&deadlineMs=200"
+    ).json
+
+    assert report["dataQuality"]["sources"] == {
+        "waqi": "pending", "open_meteo": "pending", "tomtom": "pending",
+    }
+    assert report["traffic"]["corridors"] == []
+
+
+@pytest.mark.parametrize("sections", ["traffic", "airQuality,traffic"])
+def test_waqi_outage_falls_back_to_synthetic_aqi(upstream, monkeypatch, sections):
+    def down(url, params=None, timeout=None, **kwargs):
+        raise requests.ConnectionError("waqi down")
+
+    monkeypatch.setattr(http_client._sessions["waqi"], "get", down)
+
+    response = app_module.app.test_client().get(
+        f"/api/eco-report?city=delhi&sections={sections}"
+    )
+
+    assert response.status_code == 200
+    assert response.json["dataQuality"]["sources"]["waqi"] == "synthetic"
+    assert all(c["aqi"] is not None for c in response.json["traffic"]["corridors"])
+
+
+def test_unknown_range_is_rejected(upstream):
+    calls, _ = upstream
+    response = app_module.app.test_client().get("/api/eco-report?city=pune&range=2weeks")
+
+    assert response.status_code == 400
+    assert "Unknown range" in response.json["error"]
+    assert not calls
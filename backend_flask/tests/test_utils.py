@@ -0,0 +1,34 @@
+# Run from backend_flask/: python -m pytest tests
+
+import random
+
+import pytest
+
+from services.utils import compute_time_window, downsample_lttb
+
+
+@pytest.mark.parametrize("max_points", [4, 5, 10, 50])
+def test_downsample_lttb_keeps_endpoints_and_extremes(max_points):
+    rng = random.Random(max_points)
+    values = [rng.uniform(0, 100) for _ in range(500)]
+    values[137], values[402] = 1000.0, -1000.0
+
+    picked = downsample_lttb(values, max_points)
+
+    assert len(picked) <= max_points
+    assert picked == sorted(set(picked))
+    assert picked[0] == 0 and picked[-1] == len(values) - 1
+    assert 137 in picked and 402 in picked
+
+
+def test_downsample_lttb_small_series():
+    values = [1, 2, 3, 4, 100, 5, 6, -50, 8, 9]
+    assert downsample_lttb(values, 4) == [0, 4, 7, 9]
+    # Too few points to keep both ends and both extremes: nothing is dropped.
+    assert downsample_lttb(values, 3) == list(range(len(values)))
+
+
+def test_compute_time_window_rejects_unknown_range():
+    assert compute_time_window("30d")[-1] == 30
+    with pytest.raises(ValueError, match="Unknown range"):
+        compute_time_window("fortnight")